@@ -0,0 +1,164 @@
+import json
+import logging
+import os
+from contextlib import asynccontextmanager
+
+import toml
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from components import prefetch
+from components.admission import AdmissionRejected, admission
+from components.deadlines import TurnBudget
+from components.pipeline import STAGE_DEADLINES, TURN_BUDGET, Pipeline, new_request, product_filter
+from components.query_rewrite import get_rewrite_stats
+from components.single_flight import single_flight
+from components.warmup import WarmUp
+
+# Stateless answer service, every request carries its own scope and chat history.
+# Run several workers behind one URL: uvicorn answer_service:app --host 0.0.0.0 --port 8000 --workers 4
+SECRETS_PATH = os.environ.get("KRONIA_SECRETS", ".streamlit/secrets.toml")
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(process)d - %(levelname)s - %(message)s')
+
+secrets = toml.load(SECRETS_PATH)
+pipeline = None
+warm_up = None
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Each worker process opens its own Snowflake session
+    global pipeline, warm_up
+    if secrets.get("shared_cache_path"):
+        # Product pools, presigned URLs and forecasts loaded by one worker are reused by the others
+        prefetch.use_shared_caches(secrets["shared_cache_path"])
+    pipeline = Pipeline.from_secrets(secrets)
+    # Reference data, the search service and the warehouse warm while /ready reports 503
+    warm_up = WarmUp(pipeline.warm_up_tasks(), pipeline.keep_warm, secrets.get("warm_up", {})).start()
+    yield
+    warm_up.stop()
+    pipeline.session.close()
+
+
+app = FastAPI(title="Kronia answer service", lifespan=lifespan)
+
+
+def authorize(http_request):
+    token = secrets.get("answer_service_token")
+    if token and http_request.headers.get("Authorization") != f"Bearer {token}":
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+
+def build_request(body):
+    """A pipeline request and turn budget from a JSON body.
+
+    Scope is either product_list/pest/site as the sidebar resolves them or product, site and pest names;
+    "deadlines": false runs every stage to completion.
+    """
+    scope = {key: body[key] for key in ("product_list", "pest", "site") if key in body}
+    if "product_list" not in scope:
+        scope = pipeline.scope_for(body.get("site", "ALL"), body.get("pest", "ALL"), body.get("product", "ALL"))
+    latitude, longitude = body.get("latitude"), body.get("longitude")
+    if body.get("location") and (latitude is None or longitude is None):
+        latitude, longitude = pipeline.locate(body["location"])
+    request = new_request(
+        body["question"].replace("'", ""),
+        location=body.get("location", ""),
+        latitude=latitude,
+        longitude=longitude,
+        image_analysis=body.get("image_analysis"),
+        chat_history=body.get("chat_history", []),
+        user_id=body.get("user_id"),
+        **scope,
+    )
+    if body.get("deadlines", True):
+        return request, TurnBudget(TURN_BUDGET, STAGE_DEADLINES)
+    return request, TurnBudget(float("inf"), {})
+
+
+async def read_request(http_request):
+    authorize(http_request)
+    body = await http_request.json()
+    if not body.get("question"):
+        raise HTTPException(status_code=400, detail="question is required")
+    if not body.get("user_id") and http_request.client is not None:
+        # Rate limit anonymous callers per address
+        body["user_id"] = http_request.client.host
+    # Scope and location lookups query Snowflake, keep them off the event loop
+    return await run_in_threadpool(build_request, body)
+
+
+@app.get("/health")
+def health():
+    return {"status": "ok", "pid": os.getpid()}
+
+
+@app.get("/ready")
+def ready():
+    """Readiness for the load balancer, 503 until this worker's warm-up has loaded everything."""
+    status = warm_up.get_status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+@app.get("/metrics")
+def metrics():
+    """Queue depth and admission counts of this worker, plus shared-call and query-rewrite counters."""
+    return {
+        "pid": os.getpid(),
+        "admission": admission.get_stats(),
+        "single_flight": single_flight.get_stats(),
+        "rewrite": get_rewrite_stats(),
+    }
+
+
+@app.post("/answer")
+async def answer(http_request: Request):
+    request, budget = await read_request(http_request)
+    # Pipeline calls block, run them in the thread pool to keep the event loop free for other requests
+    try:
+        result = await run_in_threadpool(pipeline.answer, request, budget)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    result["urls"] = await run_in_threadpool(lambda: {path: pipeline.get_presigned_url(path) for path in result["relative_paths"]})
+    return result
+
+
+@app.post("/answer/stream")
+async def answer_stream(http_request: Request):
+    """Newline-delimited JSON events: sources, answer deltas, then done with timings, degraded stages and document URLs."""
+    request, budget = await read_request(http_request)
+
+    def events():
+        relative_paths = []
+        try:
+            for event in pipeline.answer_stream(request, budget):
+                if event["event"] == "sources":
+                    relative_paths = event["relative_paths"]
+                elif event["event"] == "done":
+                    event["urls"] = {path: pipeline.get_presigned_url(path) for path in relative_paths}
+                    event["timings"]["total"] = round(budget.elapsed(), 2)
+                yield json.dumps(event, default=str) + "\n"
+        except AdmissionRejected as e:
+            yield json.dumps({"event": "error", "message": str(e), "busy": True}) + "\n"
+        except Exception as e:
+            # Headers are already sent, so failures are reported in the stream
+            logging.error(f"Answer stream failed: {str(e)}")
+            yield json.dumps({"event": "error", "message": str(e)}) + "\n"
+
+    # Starlette iterates a plain generator in its thread pool
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@app.post("/prefetch")
+async def prefetch_turn(http_request: Request):
+    """Warm the product pool and forecast for a scope the user is about to ask about."""
+    authorize(http_request)
+    body = await http_request.json()
+    filter_obj = product_filter(body.get("product_list", "ALL"))
+    if filter_obj is not None:
+        prefetch.submit("product pool", pipeline.prefetch_product_pool, filter_obj)
+    if body.get("latitude") is not None and body.get("longitude") is not None:
+        prefetch.submit("forecast", pipeline.fetch_forecast, body["latitude"], body["longitude"])
+    return {"status": "accepted"}
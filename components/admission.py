@@ -0,0 +1,206 @@
+import fcntl
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Lower runs first: final answers, then what the answer waits on, then auxiliary classifications and prefetch
+PRIORITIES = {
+    "answer": 0,
+    "analyst": 0,
+    "search": 1,
+    "rewrite": 2,
+    "weather": 3,
+    "weather_category": 3,
+    "prefetch": 5,
+}
+DEFAULT_PRIORITY = 4
+
+# Concurrent calls per process for each upstream ("complete", "search", "analyst")
+DEFAULT_LIMITS = {"complete": 8, "search": 16, "analyst": 4}
+USER_RATE = 1.0 # calls per second refilled into each user's bucket
+USER_BURST = 10
+QUEUE_TIMEOUT = 20 # seconds a call may wait for admission before it is rejected
+SLOT_POLL_SECONDS = 0.05
+
+
+class AdmissionRejected(Exception):
+    """Raised when a call could not be admitted in time, the caller should degrade or ask the user to retry."""
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(self):
+        """Takes a token and returns how long to wait before using it; the balance may go negative."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    def refund(self):
+        self.tokens = min(self.burst, self.tokens + 1)
+
+
+class FileSlots:
+    """Cross-process semaphore of lock files, limits concurrent calls across all worker processes on a host."""
+
+    def __init__(self, directory, name, limit):
+        os.makedirs(directory, exist_ok=True)
+        self.paths = [os.path.join(directory, f"{name}.{i}.lock") for i in range(limit)]
+
+    def acquire(self, deadline):
+        while True:
+            for path in self.paths:
+                fd = os.open(path, os.O_CREAT | os.O_RDWR)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return fd
+                except BlockingIOError:
+                    os.close(fd)
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(SLOT_POLL_SECONDS)
+
+    def release(self, fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+class _Resource:
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self.waiting = [] # heap of (priority, sequence, stage)
+        self.slots = None
+        self.stats = {"admitted": 0, "rejected": 0, "peak_queued": 0, "wait_s": 0.0}
+
+
+class AdmissionController:
+    """Bounds concurrent upstream calls per resource, serving queued calls by priority and each user at a fair rate."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.sequence = itertools.count()
+        self.resources = {}
+        self.buckets = {}
+        self.configure({})
+
+    def configure(self, settings):
+        """Settings from the [admission] secrets table: limits, user_rate, user_burst, queue_timeout and slots_dir.
+
+        With slots_dir set, shared_limits caps each resource across all worker processes on the host.
+        """
+        with self.condition:
+            self.limits = {**DEFAULT_LIMITS, **settings.get("limits", {})}
+            self.user_rate = settings.get("user_rate", USER_RATE)
+            self.user_burst = settings.get("user_burst", USER_BURST)
+            self.queue_timeout = settings.get("queue_timeout", QUEUE_TIMEOUT)
+            self.slots_dir = settings.get("slots_dir")
+            self.shared_limits = {**self.limits, **settings.get("shared_limits", {})}
+            self.resources = {}
+            self.buckets = {}
+
+    def resource(self, name):
+        # Called with the condition held
+        resource = self.resources.get(name)
+        if resource is None:
+            resource = self.resources[name] = _Resource(self.limits.get(name, 4))
+            if self.slots_dir:
+                resource.slots = FileSlots(self.slots_dir, name, self.shared_limits.get(name, resource.limit))
+        return resource
+
+    def throttle(self, user_id, deadline=None):
+        """Waits for the user's next token, so one busy session cannot take every slot; calls without a user are not rate limited.
+
+        Call it before a shared (single-flight) call, so one user's rejection is not handed to everyone waiting on it.
+        """
+        if user_id is None:
+            return
+        if deadline is None:
+            deadline = time.monotonic() + self.queue_timeout
+        with self.condition:
+            bucket = self.buckets.get(user_id)
+            if bucket is None:
+                bucket = self.buckets[user_id] = TokenBucket(self.user_rate, self.user_burst)
+            wait = bucket.reserve()
+            if time.monotonic() + wait > deadline:
+                bucket.refund()
+                raise AdmissionRejected(f"rate limit for {user_id}")
+        time.sleep(wait)
+
+    @contextmanager
+    def admit(self, name, stage, user_id=None):
+        """Holds one of the resource's slots for the duration of the block."""
+        started = time.monotonic()
+        deadline = started + self.queue_timeout
+        self.throttle(user_id, deadline)
+
+        with self.condition:
+            resource = self.resource(name)
+            entry = (PRIORITIES.get(stage, DEFAULT_PRIORITY), next(self.sequence), stage)
+            heapq.heappush(resource.waiting, entry)
+            resource.stats["peak_queued"] = max(resource.stats["peak_queued"], len(resource.waiting))
+            while resource.waiting[0] is not entry or resource.active >= resource.limit:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    resource.waiting.remove(entry)
+                    heapq.heapify(resource.waiting)
+                    resource.stats["rejected"] += 1
+                    self.condition.notify_all()
+                    raise AdmissionRejected(f"{name} queue full for {stage}")
+                self.condition.wait(remaining)
+            heapq.heappop(resource.waiting)
+            resource.active += 1
+            self.condition.notify_all()
+
+        fd = None
+        try:
+            if resource.slots is not None:
+                fd = resource.slots.acquire(deadline)
+                if fd is None:
+                    with self.condition:
+                        resource.stats["rejected"] += 1
+                    raise AdmissionRejected(f"{name} busy in other workers for {stage}")
+            with self.condition:
+                resource.stats["admitted"] += 1
+                resource.stats["wait_s"] += time.monotonic() - started
+            yield
+        finally:
+            if fd is not None:
+                resource.slots.release(fd)
+            with self.condition:
+                resource.active -= 1
+                self.condition.notify_all()
+
+    def get_stats(self):
+        """Queue depth, active calls and admission counts per resource, with queued calls broken down by stage."""
+        with self.condition:
+            stats = {}
+            for name, resource in self.resources.items():
+                queued_by_stage = {}
+                for _, _, stage in resource.waiting:
+                    queued_by_stage[stage] = queued_by_stage.get(stage, 0) + 1
+                admitted = resource.stats["admitted"]
+                stats[name] = {
+                    "limit": resource.limit,
+                    "active": resource.active,
+                    "queued": len(resource.waiting),
+                    "queued_by_stage": queued_by_stage,
+                    "admitted": admitted,
+                    "rejected": resource.stats["rejected"],
+                    "peak_queued": resource.stats["peak_queued"],
+                    "avg_wait_s": round(resource.stats["wait_s"] / admitted, 3) if admitted else 0.0,
+                }
+            return stats
+
+
+# Process-wide controller in front of Cortex Complete, Cortex Search and Cortex Analyst
+admission = AdmissionController()
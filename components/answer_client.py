@@ -0,0 +1,46 @@
+import json
+
+import requests
+
+from components.admission import AdmissionRejected
+
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 60 # longest gap between streamed events
+
+
+class AnswerServiceClient:
+    """Client for answer_service.py, used by the Streamlit app when answering runs as a separate service."""
+
+    def __init__(self, url, token=None):
+        self.url = url.rstrip("/")
+        self.headers = {"Content-Type": "application/json"}
+        if token:
+            self.headers["Authorization"] = f"Bearer {token}"
+
+    def post(self, path, payload, stream=False):
+        # default=str so Decimal and numpy coordinates from Snowflake serialize
+        response = requests.post(
+            f"{self.url}{path}",
+            data=json.dumps(payload, default=str),
+            headers=self.headers,
+            stream=stream,
+            timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+        )
+        response.raise_for_status()
+        return response
+
+    def stream_answer(self, request):
+        """Yields the service's answer events as dicts, see Pipeline.answer_stream."""
+        with self.post("/answer/stream", request, stream=True) as response:
+            for line in response.iter_lines():
+                if line:
+                    event = json.loads(line)
+                    if event["event"] == "error":
+                        # Busy services reject like the in-process admission controller does
+                        if event.get("busy"):
+                            raise AdmissionRejected(event["message"])
+                        raise RuntimeError(event["message"])
+                    yield event
+
+    def prefetch(self, product_list, latitude, longitude):
+        self.post("/prefetch", {"product_list": product_list, "latitude": latitude, "longitude": longitude})
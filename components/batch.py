@@ -0,0 +1,120 @@
+import argparse
+import json
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import toml
+
+from components.deadlines import TurnBudget
+from components.pipeline import Pipeline, new_request
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_RATE = 2.0 # questions started per second
+
+
+class RateLimiter:
+    """Spaces out starts so no more than rate questions begin per second across all workers."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_start = time.monotonic()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.interval
+        time.sleep(max(0.0, start - now))
+
+
+def read_questions(path):
+    """Questions JSONL: question plus optional id, product, site, pest, location, latitude and longitude."""
+    with open(path, 'r') as file:
+        for line_number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            # A malformed line becomes a failed record instead of ending the batch
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                item = {"id": line_number, "error": f"invalid JSON: {str(e)}"}
+            if not isinstance(item, dict):
+                item = {"id": line_number, "error": "expected a JSON object"}
+            item.setdefault("id", line_number)
+            yield item
+
+
+def answer_item(pipeline, item):
+    scope = pipeline.scope_for(item.get("site", "ALL"), item.get("pest", "ALL"), item.get("product", "ALL"))
+    latitude, longitude = item.get("latitude"), item.get("longitude")
+    if item.get("location") and (latitude is None or longitude is None):
+        latitude, longitude = pipeline.locate(item["location"])
+    request = new_request(
+        item["question"],
+        location=item.get("location", ""),
+        latitude=latitude,
+        longitude=longitude,
+        **scope,
+    )
+    # No deadlines offline, every stage runs to completion and is timed
+    budget = TurnBudget(float("inf"), {})
+    return pipeline.answer(request, budget)
+
+
+def run_batch(pipeline, questions, output, concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE):
+    """Answer questions with bounded concurrency, writing one JSON line per answer to output as each finishes."""
+    limiter = RateLimiter(rate)
+    write_lock = threading.Lock()
+    counts = {"answered": 0, "failed": 0}
+
+    def process(item):
+        record = {"id": item["id"]}
+        started = time.perf_counter()
+        try:
+            if "error" in item:
+                raise ValueError(item["error"])
+            if "question" not in item:
+                raise ValueError("missing question")
+            record["question"] = item["question"]
+            limiter.wait()
+            started = time.perf_counter()
+            record.update(answer_item(pipeline, item))
+            outcome = "answered"
+        except Exception as e:
+            logging.error(f"Batch question {item['id']} failed: {str(e)}")
+            record["error"] = str(e)
+            outcome = "failed"
+        record["total_s"] = round(time.perf_counter() - started, 2)
+        with write_lock:
+            output.write(json.dumps(record, default=str) + "\n")
+            output.flush()
+            counts[outcome] += 1
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as executor:
+        # Submit lazily so a large input file is never fully held as pending work
+        pending = set()
+        for item in questions:
+            if len(pending) >= concurrency * 2:
+                _, pending = wait(pending, return_when=FIRST_COMPLETED)
+            pending.add(executor.submit(process, item))
+        wait(pending)
+    return counts
+
+
+if __name__ == "__main__":
+    # python -m components.batch questions.jsonl answers.jsonl --concurrency 4 --rate 2
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions without the Streamlit UI")
+    parser.add_argument("questions")
+    parser.add_argument("output")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="questions started per second")
+    parser.add_argument("--secrets", default=".streamlit/secrets.toml")
+    args = parser.parse_args()
+
+    batch_pipeline = Pipeline.from_secrets(toml.load(args.secrets))
+    with open(args.output, 'w') as output:
+        counts = run_batch(batch_pipeline, read_questions(args.questions), output, args.concurrency, args.rate)
+    print(f"Answered {counts['answered']} questions, {counts['failed']} failed, written to {args.output}")
@@ -0,0 +1,124 @@
+import json
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+CONVERSATION_TABLE = "APP_ASSETS.CONVERSATION_HISTORY"
+
+# One writer keeps appends in order without blocking the chat
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="conversation-writer")
+
+
+def to_row(user_id, conversation_id, message):
+    return (
+        user_id,
+        conversation_id,
+        message["index"],
+        message["role"],
+        message["content"],
+        json.dumps(sorted(message.get("relative_paths") or [])),
+        json.dumps(message.get("timings") or {}),
+        json.dumps(message.get("degraded") or {}),
+    )
+
+
+def from_row(row):
+    index, role, content, relative_paths, timings, degraded = row
+    return {
+        "index": int(index),
+        "role": role,
+        "content": content,
+        "relative_paths": json.loads(relative_paths or "[]"),
+        "timings": json.loads(timings or "{}"),
+        "degraded": json.loads(degraded or "{}"),
+    }
+
+
+class ConversationStore(ABC):
+    """Append-only message log per user and conversation; subclasses provide execute/query."""
+
+    table = "conversation_history"
+
+    @abstractmethod
+    def execute(self, sql, params):
+        """Run a write statement with ? placeholders."""
+
+    @abstractmethod
+    def query(self, sql, params):
+        """Run a read statement with ? placeholders and return its rows as tuples."""
+
+    def append(self, user_id, conversation_id, message):
+        row = to_row(user_id, conversation_id, message)
+        sql = (
+            f"INSERT INTO {self.table} (USER_ID, CONVERSATION_ID, MESSAGE_INDEX, ROLE, CONTENT, RELATIVE_PATHS, TIMINGS, DEGRADED) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+        )
+        def write():
+            try:
+                self.execute(sql, list(row))
+            except Exception as e:
+                logging.error(f"Failed to store message {message['index']} of {conversation_id}: {str(e)}")
+        return _writer.submit(write)
+
+    def latest_conversation(self, user_id):
+        rows = self.query(
+            f"SELECT CONVERSATION_ID FROM {self.table} WHERE USER_ID = ? ORDER BY CREATED_AT DESC, MESSAGE_INDEX DESC LIMIT 1",
+            [user_id],
+        )
+        return rows[0][0] if rows else None
+
+    def load_page(self, user_id, conversation_id, before_index=None, limit=20):
+        """Up to limit messages before before_index (or the latest ones), oldest first."""
+        sql = f"SELECT MESSAGE_INDEX, ROLE, CONTENT, RELATIVE_PATHS, TIMINGS, DEGRADED FROM {self.table} WHERE USER_ID = ? AND CONVERSATION_ID = ?"
+        params = [user_id, conversation_id]
+        if before_index is not None:
+            sql += " AND MESSAGE_INDEX < ?"
+            params.append(before_index)
+        sql += " ORDER BY MESSAGE_INDEX DESC LIMIT ?"
+        params.append(limit)
+        return [from_row(row) for row in reversed(self.query(sql, params))]
+
+
+class SnowflakeConversationStore(ConversationStore):
+
+    def __init__(self, session, app_db):
+        self.session = session
+        self.table = f"{app_db}.{CONVERSATION_TABLE}"
+        self.session.sql(f"""
+        CREATE TABLE IF NOT EXISTS {self.table} (
+            USER_ID VARCHAR, CONVERSATION_ID VARCHAR, MESSAGE_INDEX NUMBER, ROLE VARCHAR, CONTENT VARCHAR,
+            RELATIVE_PATHS VARCHAR, TIMINGS VARCHAR, DEGRADED VARCHAR, CREATED_AT TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP()
+        )
+        """).collect()
+
+    def execute(self, sql, params):
+        self.session.sql(sql, params=params).collect()
+
+    def query(self, sql, params):
+        return [tuple(row) for row in self.session.sql(sql, params=params).collect()]
+
+
+class SQLiteConversationStore(ConversationStore):
+    """Local stand-in for development and offline runs."""
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(f"""
+        CREATE TABLE IF NOT EXISTS {self.table} (
+            USER_ID TEXT, CONVERSATION_ID TEXT, MESSAGE_INDEX INTEGER, ROLE TEXT, CONTENT TEXT,
+            RELATIVE_PATHS TEXT, TIMINGS TEXT, DEGRADED TEXT, CREATED_AT TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+        self.db.commit()
+
+    def execute(self, sql, params):
+        with self.lock:
+            self.db.execute(sql, params)
+            self.db.commit()
+
+    def query(self, sql, params):
+        with self.lock:
+            return self.db.execute(sql, params).fetchall()
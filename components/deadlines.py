@@ -0,0 +1,72 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+# Stage calls wait on admission (components.admission) rather than on this pool, so it covers the summed upstream limits
+STAGE_WORKERS = 32
+
+_executor = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix="stage")
+
+
+class TurnBudget:
+    """Latency budget for one chat turn: per-stage deadlines, stage timings and the stages that were degraded."""
+
+    def __init__(self, total_seconds, stage_deadlines):
+        self.started = time.monotonic()
+        self.total_seconds = total_seconds
+        self.stage_deadlines = stage_deadlines
+        self.timings = {}
+        self.degraded = {}
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def remaining(self):
+        return max(0.0, self.total_seconds - self.elapsed())
+
+    def degrade(self, stage, reason):
+        self.degraded[stage] = reason
+        logging.warning(f"Turn degraded at {stage}: {reason}")
+
+    def run(self, stage, fn, *args, fallback=None, **kwargs):
+        """Run one stage. Stages with a deadline return fallback when they overrun or fail; others run to completion."""
+        started = time.monotonic()
+        deadline = self.stage_deadlines.get(stage)
+        try:
+            if deadline is None:
+                return fn(*args, **kwargs)
+
+            timeout = min(deadline, self.remaining())
+            if timeout <= 0:
+                self.degrade(stage, "no time left")
+                return fallback
+
+            # Inside Streamlit the worker needs the session's script context to read st.session_state
+            ctx = get_script_run_ctx(suppress_warning=True)
+            running = threading.Event()
+            def call():
+                running.set()
+                if ctx is not None:
+                    add_script_run_ctx(threading.current_thread(), ctx)
+                return fn(*args, **kwargs)
+
+            future = _executor.submit(call)
+            try:
+                # Time queued behind other turns' stages counts against the turn, the stage deadline starts when it runs
+                queue_timeout = self.remaining() if self.total_seconds != float("inf") else None
+                if not running.wait(queue_timeout):
+                    future.cancel()
+                    self.degrade(stage, "still queued when the turn ran out")
+                    return fallback
+                return future.result(timeout=timeout)
+            except TimeoutError:
+                # The upstream call cannot be cancelled once running, it finishes in the background and is discarded
+                self.degrade(stage, f"timed out after {timeout:.1f}s")
+            except Exception as e:
+                self.degrade(stage, f"failed: {str(e)}")
+            return fallback
+        finally:
+            self.timings[stage] = round(time.monotonic() - started, 2)
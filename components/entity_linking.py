@@ -0,0 +1,155 @@
+import re
+from collections import deque
+
+ENTITY_COLUMNS = ("PRODUCTNAME", "PEST", "SITE")
+MIN_ENTITY_CHARS = 3 # single-word names shorter than this match too much ordinary text
+FUZZY_MIN_CHARS = 5 # shorter words are only matched exactly, "corn" must not match "core"
+FUZZY_COLUMNS = ("PRODUCTNAME",) # pest and site names are ordinary words, "rates" must not become "rats"
+
+# Words common in questions that must never be corrected into a name, e.g. "apply" into "apple"
+COMMON_WORDS = {
+    "about", "after", "again", "apply", "applying", "applied", "application", "applications", "before",
+    "being", "between", "could", "doing", "during", "every", "first", "given", "going", "label", "labels",
+    "later", "other", "outside", "inside", "product", "products", "rates", "right", "safe", "should",
+    "since", "spray", "sprays", "spraying", "sprayed", "still", "their", "there", "these", "thing", "things",
+    "those", "today", "under", "until", "using", "water", "watering", "weather", "where", "which", "while",
+    "would", "years", "mixing", "mixed", "treat", "treated", "treating", "plant", "plants", "planting",
+    "harvest", "interval", "restricted", "entry", "ingredient", "active", "dosage", "acre", "acres",
+    "gallon", "gallons", "ounce", "ounces", "pound", "pounds", "tomorrow", "weekend", "morning", "evening",
+}
+
+# Ordinary words that are also whole product names, "hot out" must not link OUT and "max rate" must not link Max
+ORDINARY_WORDS = COMMON_WORDS | {
+    "ace", "all", "any", "best", "big", "bold", "clean", "clear", "cold", "cover", "dry", "edge", "fast",
+    "field", "final", "fire", "free", "fresh", "full", "gold", "good", "green", "guard", "home", "hot",
+    "kill", "last", "lawn", "max", "more", "much", "new", "now", "off", "one", "only", "out", "over",
+    "plus", "power", "prime", "pro", "quick", "rain", "ready", "sure", "shield", "stop", "strike",
+    "super", "total", "up", "ultra", "wet", "what", "when", "yard",
+}
+
+
+def tokenize(text):
+    return re.findall(r"[a-z0-9]+", str(text).lower())
+
+
+def is_distinctive(name):
+    """False for product names that are a single ordinary word, they read as a mention in almost any question."""
+    tokens = tokenize(name)
+    return bool(tokens) and not (len(tokens) == 1 and (len(tokens[0]) < MIN_ENTITY_CHARS or tokens[0] in ORDINARY_WORDS))
+
+
+def deletions(token):
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+def within_one_edit(a, b):
+    """One insertion, deletion, substitution or adjacent transposition apart."""
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) == len(b):
+        diffs = [i for i in range(len(a)) if a[i] != b[i]]
+        if len(diffs) == 1:
+            return True
+        return len(diffs) == 2 and diffs[1] == diffs[0] + 1 and a[diffs[0]] == b[diffs[1]] and a[diffs[1]] == b[diffs[0]]
+    shorter, longer = (a, b) if len(a) < len(b) else (b, a)
+    i = 0
+    while i < len(shorter) and shorter[i] == longer[i]:
+        i += 1
+    return shorter[i:] == longer[i + 1:]
+
+
+class EntityLinker:
+    """Word-level Aho-Corasick automaton over product, pest and site names.
+
+    Finds every name mentioned in a text in one pass over its words. Misspelled product names are
+    first mapped to the one known product word within a single edit; pest and site names match exactly.
+    Products named by a single ordinary word are never linked.
+    """
+
+    def __init__(self, entities):
+        # entities: (column, value) pairs
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        self.vocabulary = set()
+        fuzzy_vocabulary = set()
+        for column, value in entities:
+            tokens = tokenize(value)
+            if not tokens or (len(tokens) == 1 and len(tokens[0]) < MIN_ENTITY_CHARS):
+                continue
+            # Pest and site names are ordinary words by nature, only products need a distinctive name
+            if column == "PRODUCTNAME" and not is_distinctive(value):
+                continue
+            if column in FUZZY_COLUMNS:
+                fuzzy_vocabulary.update(tokens)
+            node = 0
+            for token in tokens:
+                self.vocabulary.add(token)
+                if token not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[node][token] = len(self.goto) - 1
+                node = self.goto[node][token]
+            self.output[node].append((len(tokens), column, value))
+        self.build_failure_links()
+
+        # Deletion neighbourhoods find candidate corrections without comparing against the whole vocabulary
+        self.deletion_index = {}
+        for token in fuzzy_vocabulary:
+            if len(token) >= FUZZY_MIN_CHARS - 1 and not token.isdigit() and token not in COMMON_WORDS:
+                for key in deletions(token) | {token}:
+                    self.deletion_index.setdefault(key, set()).add(token)
+
+    @classmethod
+    def from_dropdown(cls, data_df):
+        return cls(
+            (column, value)
+            for column in ENTITY_COLUMNS
+            for value in data_df[column].dropna().unique()
+        )
+
+    def build_failure_links(self):
+        # Breadth first, names at the root's children fail back to the root
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for token, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and token not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(token, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def correct(self, token):
+        if token in self.vocabulary or token in COMMON_WORDS or len(token) < FUZZY_MIN_CHARS or token.isdigit():
+            return token
+        candidates = set()
+        for key in deletions(token) | {token}:
+            candidates |= self.deletion_index.get(key, set())
+        candidates = {candidate for candidate in candidates if within_one_edit(token, candidate)}
+        # Ambiguous corrections are left alone
+        return candidates.pop() if len(candidates) == 1 else token
+
+    def link(self, text):
+        """Names mentioned in text by column, longest match first where mentions overlap."""
+        matches = []
+        node = 0
+        for end, token in enumerate(self.correct(token) for token in tokenize(text)):
+            while node and token not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(token, 0)
+            for length, column, value in self.output[node]:
+                matches.append((end + 1 - length, end + 1, column, value))
+
+        # Leftmost-longest spans, a name like "Roundup PowerMAX" wins over "Roundup" inside it
+        entities = {}
+        covered_until = 0
+        matches.sort(key=lambda match: (match[0], match[0] - match[1]))
+        chosen = None
+        for start, end, column, value in matches:
+            if chosen == (start, end) or start >= covered_until:
+                chosen, covered_until = (start, end), end
+                entities.setdefault(column, set()).add(value)
+        return {column: sorted(values) for column, values in entities.items()}
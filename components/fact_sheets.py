@@ -0,0 +1,183 @@
+import re
+
+import pandas as pd
+
+from components.entity_linking import is_distinctive
+from components.query_rewrite import word_sequence
+
+FACT_SHEET_TABLE = "APP_ASSETS.PRODUCT_FACT_SHEETS"
+EXTRACTION_MODEL = "mistral-large2"
+MAX_SECTION_CHARS = 6000
+
+# fact type -> (fact sheet column, display label, phrases that ask for it)
+FACT_TYPES = {
+    "signal_word": ("SIGNAL_WORD", "Signal word", ("signal word",)),
+    "active_ingredient": ("ACTIVE_INGREDIENT", "Active ingredient", ("active ingredient", "active ingredients", "a.i.")),
+    "ppe": ("PPE", "PPE", ("ppe", "protective equipment", "protective gear", "protective clothing", "what should i wear", "what to wear")),
+    "mode_of_action": ("MODE_OF_ACTION", "Mode of action", ("mode of action", "moa", "how does it work", "irac", "frac", "hrac", "resistance group")),
+    "company": ("COMPANYNAME", "Company", ("company", "manufacturer", "who makes", "registrant", "made by")),
+}
+
+# Questions with these cues need the label context and the LLM, not just a fact
+NON_LOOKUP_CUES = (
+    "can i", "should i", "mix", "rate", "dosage", "dose", "apply", "application", "when", "weather",
+    "rain", "wind", "compare", "versus", "vs", "better", "instead", "why", "image", "store", "first aid",
+)
+
+# Words a fact question may hold besides its fact phrases and product name, anything else goes through RAG
+FILLER_WORDS = {
+    "a", "an", "and", "are", "does", "for", "has", "have", "i", "in", "is", "its", "label", "list", "me",
+    "need", "needed", "of", "on", "please", "product", "required", "requires", "s", "show", "tell", "the",
+    "this", "what", "whats", "which", "who",
+}
+
+# Source chunks kept for each extracted column, matched with ILIKE
+SECTION_PATTERNS = {
+    "ACTIVE_INGREDIENT": ("%active ingredient%",),
+    "PPE": ("%personal protective equipment%", "%ppe%", "%applicators and other handlers must wear%"),
+    "MODE_OF_ACTION": ("%mode of action%", "%group%", "%resistance management%"),
+}
+
+EXTRACTION_PROMPTS = {
+    "ACTIVE_INGREDIENT": "List the active ingredient(s) with their percentage by weight from this pesticide label text.",
+    "PPE": "List the personal protective equipment required for applicators and other handlers from this pesticide label text.",
+    "MODE_OF_ACTION": "State the mode of action group (IRAC/FRAC/HRAC number and name) from this pesticide label text.",
+}
+
+
+def build_fact_sheets(session, source_table, target_table, model=EXTRACTION_MODEL):
+    """Offline job: extract one row of label facts per PRODUCTNAME from the chunk table into target_table."""
+    section_columns = []
+    extracted_columns = []
+    for column, patterns in SECTION_PATTERNS.items():
+        condition = " OR ".join(f"chunk ILIKE '{pattern}'" for pattern in patterns)
+        section_columns.append(
+            f"LEFT(LISTAGG(CASE WHEN {condition} THEN chunk END, '\\n') WITHIN GROUP (ORDER BY relative_path), {MAX_SECTION_CHARS}) AS {column}_TEXT"
+        )
+        instruction = EXTRACTION_PROMPTS[column].replace("'", "''")
+        extracted_columns.append(
+            f"IFF({column}_TEXT IS NULL OR {column}_TEXT = '', NULL, TRIM(SNOWFLAKE.CORTEX.COMPLETE('{model}', "
+            f"'{instruction} Answer briefly with only the facts. If not stated, answer NOT FOUND.\\n\\n' || {column}_TEXT))) AS {column}"
+        )
+
+    build_sql = f"""
+    CREATE OR REPLACE TABLE {target_table} AS
+    WITH sections AS (
+        SELECT
+            PRODUCTNAME,
+            ANY_VALUE(COMPANYNAME) AS COMPANYNAME,
+            MODE(SIGNAL_WORD) AS SIGNAL_WORD,
+            MIN(relative_path) AS RELATIVE_PATH,
+            {", ".join(section_columns)}
+        FROM {source_table}
+        WHERE PRODUCTNAME IS NOT NULL
+        GROUP BY PRODUCTNAME
+    )
+    SELECT
+        PRODUCTNAME,
+        COMPANYNAME,
+        SIGNAL_WORD,
+        RELATIVE_PATH,
+        {", ".join(extracted_columns)},
+        CURRENT_TIMESTAMP() AS LAST_UPDATED
+    FROM sections
+    """
+    session.sql(build_sql).collect()
+    return session.sql(f"SELECT COUNT(*) AS N FROM {target_table}").collect()[0]["N"]
+
+
+def load_fact_sheets(session, app_db):
+    query = f"""
+    SELECT *
+    FROM {app_db}.{FACT_SHEET_TABLE}
+    """
+    try:
+        data_df = session.sql(query).to_pandas()
+    except Exception:
+        # Table not built yet, every question goes through RAG
+        return {}
+    return {str(row["PRODUCTNAME"]).upper(): row for row in data_df.to_dict(orient="records")}
+
+
+def match_fact_types(question):
+    lowered = question.lower()
+    if any(re.search(rf"\b{re.escape(cue)}\b", lowered) for cue in NON_LOOKUP_CUES):
+        return []
+    words = word_sequence(question)
+    return [
+        fact_type
+        for fact_type, (_, _, phrases) in FACT_TYPES.items()
+        if any(word_sequence(phrase) in words for phrase in phrases)
+    ]
+
+
+def mentioned_products(question, fact_sheets):
+    # Whole words only, a product named "OUT" must not match "outside", and ordinary-word names not at all
+    words = word_sequence(question)
+    mentioned = [name for name in fact_sheets if is_distinctive(name) and word_sequence(name) in words]
+    # Drop names contained in a longer mention so "Roundup PowerMAX" is not also read as "Roundup"
+    return [
+        name for name in mentioned
+        if not any(name != other and word_sequence(name) in word_sequence(other) for other in mentioned)
+    ]
+
+
+def match_product(question, fact_sheets, selected_products):
+    mentioned = mentioned_products(question, fact_sheets)
+    if isinstance(selected_products, list):
+        # The sidebar selection bounds the answer, a name outside it is not served from the table
+        selected = [str(product).upper() for product in selected_products]
+        if mentioned:
+            mentioned = [name for name in mentioned if name in selected]
+            return mentioned[0] if len(mentioned) == 1 else None
+        return selected[0] if len(selected) == 1 else None
+    return mentioned[0] if len(mentioned) == 1 else None
+
+
+def covers_question(question, fact_types, fact_sheets):
+    """Whether the fact phrases and product names account for the whole question, leaving only filler words."""
+    words = word_sequence(question)
+    phrases = [phrase for fact_type in fact_types for phrase in FACT_TYPES[fact_type][2]]
+    names = [name for name in fact_sheets if is_distinctive(name)]
+    for text in sorted(phrases + names, key=lambda text: -len(word_sequence(text))):
+        if word_sequence(text).strip():
+            words = words.replace(word_sequence(text), " ")
+    return all(word in FILLER_WORDS for word in words.split())
+
+
+def lookup_facts(question, fact_sheets, selected_products="ALL"):
+    """Answer a single-product fact question from the fact sheet table, or None when RAG is needed."""
+    if not fact_sheets:
+        return None
+    fact_types = match_fact_types(question)
+    if not fact_types:
+        return None
+    if not covers_question(question, fact_types, fact_sheets):
+        return None
+    product = match_product(question, fact_sheets, selected_products)
+    if product is None or product not in fact_sheets:
+        return None
+
+    sheet = fact_sheets[product]
+    lines = []
+    for fact_type in fact_types:
+        column, label, _ = FACT_TYPES[fact_type]
+        value = sheet.get(column)
+        if value is None or pd.isna(value) or "NOT FOUND" in str(value).upper():
+            return None
+        lines.append(f"**{label}:** {value}")
+
+    answer = f"**{sheet['PRODUCTNAME']}**\n\n" + "\n\n".join(lines)
+    relative_paths = {sheet["RELATIVE_PATH"]} if sheet.get("RELATIVE_PATH") else set()
+    return answer, relative_paths
+
+
+if __name__ == "__main__":
+    # python -m components.fact_sheets <source chunk table> <target fact sheet table>
+    # Uses the default connection from ~/.snowflake/connections.toml
+    import sys
+    from snowflake.snowpark import Session
+
+    source_table, target_table = sys.argv[1], sys.argv[2]
+    job_session = Session.builder.getOrCreate()
+    print(f"Built {build_fact_sheets(job_session, source_table, target_table)} fact sheets into {target_table}")
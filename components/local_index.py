@@ -0,0 +1,163 @@
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+EMBED_MODEL = "snowflake-arctic-embed-m"
+EMBED_DIM = 768
+SYNC_BATCH_SIZE = 50 # relative paths pulled per round trip during sync
+
+
+def embed_query(session, text, model=EMBED_MODEL):
+    """Embed a query with the same Cortex model used for the mirrored chunks."""
+    row = session.sql(
+        "SELECT SNOWFLAKE.CORTEX.EMBED_TEXT_768(?, ?) AS EMBEDDING", params=[model, text]
+    ).collect()[0]
+    return to_vector(row["EMBEDDING"])
+
+
+def to_vector(value):
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.asarray(value, dtype=np.float32)
+
+
+def normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def filter_mask(filter_obj, metadata):
+    """Boolean mask over metadata rows with the Cortex Search filter semantics (@eq, @contains, @and, @or, @not)."""
+    if not filter_obj:
+        return np.ones(len(metadata), dtype=bool)
+    (operator, operand), = filter_obj.items()
+    if operator == "@eq":
+        (column, value), = operand.items()
+        return (metadata[column] == value).to_numpy()
+    if operator == "@contains":
+        (column, value), = operand.items()
+        return metadata[column].fillna("").str.contains(value, regex=False).to_numpy()
+    if operator == "@and":
+        return np.logical_and.reduce([filter_mask(clause, metadata) for clause in operand])
+    if operator == "@or":
+        return np.logical_or.reduce([filter_mask(clause, metadata) for clause in operand])
+    if operator == "@not":
+        return ~filter_mask(operand, metadata)
+    raise ValueError(f"Unsupported filter operator: {operator}")
+
+
+class LocalChunkIndex:
+    """Local mirror of the label chunk corpus: a memory-mapped embedding matrix plus a SQLite metadata store."""
+
+    def __init__(self, directory, columns, dim=EMBED_DIM):
+        self.directory = directory
+        self.columns = list(columns)
+        self.dim = dim
+        self.embeddings_path = os.path.join(directory, "embeddings.f32")
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(directory, "metadata.sqlite"), check_same_thread=False)
+        column_defs = ", ".join(f'"{column}" TEXT' for column in self.columns if column != "relative_path")
+        self.db.execute(
+            f'CREATE TABLE IF NOT EXISTS chunks (row_id INTEGER PRIMARY KEY, "relative_path" TEXT, deleted INTEGER DEFAULT 0, {column_defs})'
+        )
+        self.db.execute("CREATE TABLE IF NOT EXISTS files (relative_path TEXT PRIMARY KEY, fingerprint TEXT)")
+        self.db.commit()
+        self._load()
+
+    def _stored_rows(self):
+        return os.path.getsize(self.embeddings_path) // (4 * self.dim) if os.path.exists(self.embeddings_path) else 0
+
+    def _load(self):
+        rows = self._stored_rows()
+        self.embeddings = (
+            np.memmap(self.embeddings_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+            if rows else np.empty((0, self.dim), dtype=np.float32)
+        )
+        select_cols = ", ".join(f'"{column}"' for column in self.columns)
+        self.metadata = pd.read_sql(
+            f"SELECT row_id, {select_cols} FROM chunks WHERE deleted = 0 ORDER BY row_id", self.db
+        )
+        self.row_ids = self.metadata["row_id"].to_numpy()
+
+    def __len__(self):
+        return len(self.metadata)
+
+    def add_chunks(self, chunks_df, embeddings):
+        """Append chunk rows and their embeddings; row ids follow the embedding file order."""
+        embeddings = normalize(np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim))
+        # The file, not the loaded memmap, is the row count: sync appends several batches before reloading
+        start = self._stored_rows()
+        with open(self.embeddings_path, "ab") as handle:
+            handle.write(embeddings.tobytes())
+        insert_cols = ", ".join(['row_id'] + [f'"{column}"' for column in self.columns])
+        placeholders = ", ".join("?" * (len(self.columns) + 1))
+        self.db.executemany(
+            f"INSERT INTO chunks ({insert_cols}) VALUES ({placeholders})",
+            [
+                (start + offset, *[None if pd.isna(row[c]) else str(row[c]) for c in self.columns])
+                for offset, (_, row) in enumerate(chunks_df.iterrows())
+            ],
+        )
+
+    def remove_paths(self, relative_paths):
+        self.db.executemany(
+            'UPDATE chunks SET deleted = 1 WHERE "relative_path" = ?', [(path,) for path in relative_paths]
+        )
+        self.db.executemany("DELETE FROM files WHERE relative_path = ?", [(path,) for path in relative_paths])
+
+    def sync(self, session, source_table, model=EMBED_MODEL):
+        """Incrementally mirror source_table, re-pulling only relative paths whose chunks changed."""
+        remote = session.sql(
+            f'SELECT relative_path AS "relative_path", TO_VARCHAR(HASH_AGG(chunk)) AS "fingerprint" '
+            f"FROM {source_table} GROUP BY relative_path"
+        ).to_pandas()
+        remote_prints = dict(zip(remote["relative_path"], remote["fingerprint"]))
+        local_prints = dict(self.db.execute("SELECT relative_path, fingerprint FROM files").fetchall())
+
+        changed = [path for path, fingerprint in remote_prints.items() if local_prints.get(path) != fingerprint]
+        removed = [path for path in local_prints if path not in remote_prints]
+
+        select_cols = ", ".join(f'{column} AS "{column}"' for column in self.columns)
+        with self.lock:
+            self.remove_paths(changed + removed)
+            for start in range(0, len(changed), SYNC_BATCH_SIZE):
+                batch = changed[start:start + SYNC_BATCH_SIZE]
+                placeholders = ", ".join("?" * len(batch))
+                chunks_df = session.sql(
+                    f'SELECT {select_cols}, SNOWFLAKE.CORTEX.EMBED_TEXT_768(?, chunk) AS "embedding" '
+                    f"FROM {source_table} WHERE relative_path IN ({placeholders})",
+                    params=[model, *batch],
+                ).to_pandas()
+                if len(chunks_df):
+                    self.add_chunks(chunks_df, np.stack(chunks_df["embedding"].map(to_vector).to_list()))
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO files (relative_path, fingerprint) VALUES (?, ?)",
+                    [(path, remote_prints[path]) for path in batch],
+                )
+                self.db.commit()
+            self.db.commit()
+            self._load()
+        return {"changed": len(changed), "removed": len(removed), "chunks": len(self)}
+
+    def search(self, query_embedding, columns, filter=None, limit=10):
+        """Top-k cosine search shaped like a Cortex Search response: {"results": [...]}."""
+        with self.lock:
+            metadata, row_ids, embeddings = self.metadata, self.row_ids, self.embeddings
+        if not len(metadata):
+            return {"results": []}
+        candidates = np.flatnonzero(filter_mask(filter, metadata))
+        if not len(candidates):
+            return {"results": []}
+        query = normalize(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+        scores = embeddings[row_ids[candidates]] @ query
+        top = min(limit, len(candidates))
+        best = np.argpartition(-scores, top - 1)[:top]
+        best = best[np.argsort(-scores[best])]
+        rows = metadata.iloc[candidates[best]]
+        return {"results": rows[list(columns)].to_dict(orient="records")}
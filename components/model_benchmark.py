@@ -0,0 +1,94 @@
+import argparse
+import json
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from components.prompts import need_weather_prompt, weather_category_prompt, rewrite_prompt, parse_yes_no, parse_weather_categories
+
+EVAL_SET = Path(__file__).parent / 'stage_eval_questions.jsonl'
+DEFAULT_MODELS = ["mistral-7b", "llama3.1-8b", "mixtral-8x7b", "mistral-large2"]
+
+
+def load_eval_set(path=EVAL_SET):
+    with open(path, 'r') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def build_prompt(case):
+    if case["stage"] == "weather":
+        return need_weather_prompt(case["question"])
+    if case["stage"] == "weather_category":
+        return weather_category_prompt(case["question"])
+    return rewrite_prompt(case["chat_history"], case["question"])
+
+
+def agrees(case, response):
+    """Whether a model response matches the labelled answer for its stage."""
+    if case["stage"] == "weather":
+        return parse_yes_no(response) == (case["expected"] == "Yes")
+    if case["stage"] == "weather_category":
+        return set(parse_weather_categories(response)) == set(case["expected"])
+    lowered = response.lower()
+    return all(term in lowered for term in case["expected_terms"])
+
+
+def run_benchmark(complete, models, cases):
+    """Call complete(model, prompt) for every case and model; returns one row per call."""
+    rows = []
+    for model in models:
+        for case in cases:
+            started = time.perf_counter()
+            try:
+                response = complete(model, build_prompt(case))
+                error = None
+            except Exception as e:
+                response, error = "", str(e)
+            rows.append({
+                "stage": case["stage"],
+                "model": model,
+                "latency_s": time.perf_counter() - started,
+                "agrees": error is None and agrees(case, response),
+                "error": error,
+            })
+    return pd.DataFrame(rows)
+
+
+def summarize(results):
+    """Agreement and latency percentiles per stage and model."""
+    return (
+        results.groupby(["stage", "model"])
+        .agg(
+            n=("agrees", "size"),
+            agreement=("agrees", "mean"),
+            p50_latency_s=("latency_s", "median"),
+            p95_latency_s=("latency_s", lambda latency: latency.quantile(0.95)),
+            errors=("error", "count"),
+        )
+        .round(3)
+        .reset_index()
+    )
+
+
+if __name__ == "__main__":
+    # python -m components.model_benchmark --models mistral-7b,mistral-large2
+    # Uses the default connection from ~/.snowflake/connections.toml
+    from snowflake.cortex import Complete
+    from snowflake.snowpark import Session
+
+    parser = argparse.ArgumentParser(description="Latency and agreement of Cortex models per pipeline stage")
+    parser.add_argument("--models", default=",".join(DEFAULT_MODELS))
+    parser.add_argument("--eval-set", default=str(EVAL_SET))
+    parser.add_argument("--output", help="optional CSV of every call")
+    args = parser.parse_args()
+
+    bench_session = Session.builder.getOrCreate()
+    results = run_benchmark(
+        lambda model, prompt: Complete(model, prompt, session=bench_session),
+        args.models.split(","),
+        load_eval_set(args.eval_set),
+    )
+    if args.output:
+        results.to_csv(args.output, index=False)
+    print(summarize(results).to_string(index=False))
@@ -0,0 +1,463 @@
+import json
+import logging
+import threading
+import time
+
+import requests
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from snowflake.core import Root
+from snowflake.cortex import Complete
+from snowflake.snowpark import Session
+
+from components import prefetch
+from components.admission import AdmissionRejected, admission
+from components.deadlines import TurnBudget
+from components.dropdown import load_dropdown_data
+from components.entity_linking import EntityLinker
+from components.fact_sheets import load_fact_sheets, lookup_facts
+from components.local_index import LocalChunkIndex, embed_query
+from components.prompts import (
+    WEATHER_CATEGORIES,
+    answer_prompt,
+    need_weather_prompt,
+    parse_weather_categories,
+    parse_yes_no,
+    rewrite_prompt,
+    weather_category_prompt,
+)
+from components.query_rewrite import get_rewrite_stats, needs_history, record_rewrite
+from components.rerank import agrees, merge_results, rerank_chunks
+from components.single_flight import prompt_key, search_key, single_flight, weather_key
+from components.spray_windows import summarize_spray_windows
+from components.warmup import keep_warm_sql
+
+# Cortex model per pipeline stage, small fast models for the one-word classifications and the rewrite.
+# Override with a [stage_models] table in secrets; compare choices with python -m components.model_benchmark
+DEFAULT_STAGE_MODELS = {
+    "weather": "mistral-7b",
+    "weather_category": "mistral-7b",
+    "rewrite": "llama3.1-8b",
+    "answer": "mistral-large2",
+}
+
+# columns to query in the service
+COLUMNS = [
+    "chunk",
+    "relative_path",
+    "PRODUCTNAME",
+    "COMPANYNAME",
+    "CATEGORY_EPA_TYPE",
+    "SIGNAL_WORD"
+]
+
+# Per-turn latency budget in seconds, stages without a deadline always run to completion
+TURN_BUDGET = 15
+STAGE_DEADLINES = {
+    "weather": 4, # answer without weather
+    "rewrite": 3, # search with the raw question
+}
+
+NUM_CANDIDATES = 30 # chunks fetched from the search service before local reranking
+NUM_CHUNKS = 6 # chunks passed to the answer prompt after reranking
+ANSWER_RESERVE = 8 # when less time than this is left before the answer, send fewer chunks
+DEGRADED_NUM_CHUNKS = 3
+MAX_LINKED_PRODUCTS = 20 # pest or site mentions covering more products than this are too broad to filter on
+POOL_TTL = 900 # seconds a prefetched product chunk pool stays warm
+URL_TTL = 300 # presigned URLs are generated for 360 seconds
+FORECAST_TTL = 600
+REFERENCE_TTL = 3600 # fact sheets and product names
+# Abandoned stages keep their thread until the upstream call returns, so every call is bounded
+FORECAST_TIMEOUT = (3, 10) # connect and read seconds for OpenWeather
+COMPLETE_TIMEOUT = 60 # seconds Cortex Complete may spend, including its retries
+
+# Generic label-section queries used to warm a product-scoped chunk pool before the first question
+PREFETCH_QUERIES = [
+    "directions for use and application rates",
+    "personal protective equipment and first aid",
+    "environmental hazards and precautionary statements",
+    "storage and disposal",
+    "target pests and crops",
+    "active ingredient and mode of action",
+]
+
+
+def connection_parameters(secrets):
+    p_key = serialization.load_pem_private_key(
+        secrets["private_key_file"].encode('utf-8'),
+        password=None,
+        backend=default_backend()
+    )
+    return {
+        "account": secrets["account"],
+        "user": secrets["user"],
+        "password": secrets["password"],
+        "database": secrets["database"],
+        "warehouse": secrets["warehouse"],
+        "schema": secrets["schema"],
+        "private_key": p_key
+    }
+
+
+def create_session(secrets):
+    return Session.builder.configs(connection_parameters(secrets)).create()
+
+
+def product_filter(product_list):
+    if product_list == "ALL":
+        return None
+    eq_conditions = [
+        {"@eq": {"PRODUCTNAME": product}}
+        for product in product_list
+    ]
+    if len(eq_conditions) == 1:
+        return eq_conditions[0]
+    return {"@or": eq_conditions}
+
+
+def pool_key(filter_obj):
+    return json.dumps(filter_obj, sort_keys=True)
+
+
+def new_request(question, **scope):
+    """A pipeline request: the question plus the filters, location, image analysis and history it is asked with."""
+    return {
+        "question": question,
+        "product_list": scope.get("product_list", "ALL"),
+        "pest": scope.get("pest", "ALL"),
+        "site": scope.get("site", "ALL"),
+        "location": scope.get("location", ""),
+        "latitude": scope.get("latitude"),
+        "longitude": scope.get("longitude"),
+        "image_analysis": scope.get("image_analysis"),
+        "chat_history": scope.get("chat_history", []),
+        "user_id": scope.get("user_id"), # None skips the per-user rate limit, e.g. batch jobs pace themselves
+    }
+
+
+class Pipeline:
+    """Kronia's retrieval and answer pipeline without any Streamlit state; every request carries its own scope."""
+
+    def __init__(self, session, secrets):
+        self.session = session
+        db_env = secrets["environment"]
+        self.ingest_db = f"{db_env}_SRC_INGEST"
+        self.app_db = f"{db_env}_DP_APP"
+        self.open_weather_api_key = secrets["open_weather_api_key"]
+        self.stage_models = {**DEFAULT_STAGE_MODELS, **secrets.get("stage_models", {})}
+
+        # service parameters
+        search_database = secrets["database"]
+        search_schema = secrets["schema"]
+        search_service = f"CC_SEARCH_SERVICE_CS_{search_database}"
+        self.svc = Root(session).databases[search_database].schemas[search_schema].cortex_search_services[search_service]
+
+        # local mirror of the chunk corpus ("service" searches Cortex Search first, "local" searches the mirror only)
+        self.retrieval_backend = secrets.get("retrieval_backend", "service")
+        self.local_index_dir = secrets.get("local_index_dir", ".local_index")
+        self.local_index_sync = secrets.get("local_index_sync", False)
+        self.chunks_table = secrets.get("chunks_table", f"{search_database}.{search_schema}.DOCS_CHUNKS_TABLE")
+        self._local_index = None
+        self._local_index_lock = threading.Lock()
+        self.reference_cache = prefetch.TTLCache()
+        # Scope unfiltered searches to the products, pests and sites a question names
+        self.entity_linking = secrets.get("entity_linking", True)
+
+        self.keep_warm_sql = secrets.get("warm_up", {}).get("keep_warm_query", keep_warm_sql(f"{self.app_db}.APP_ASSETS.DROPDOWN_DATA"))
+
+        # Concurrency limits and per-user rates for Cortex calls, see components/admission.py
+        admission.configure(secrets.get("admission", {}))
+
+    @classmethod
+    def from_secrets(cls, secrets):
+        return cls(create_session(secrets), secrets)
+
+    ### Shared resources
+    def local_index(self):
+        with self._local_index_lock:
+            if self._local_index is None:
+                self._local_index = LocalChunkIndex(self.local_index_dir, COLUMNS)
+                if self.local_index_sync:
+                    try:
+                        logging.info(f"Local index sync: {self._local_index.sync(self.session, self.chunks_table)}")
+                    except Exception as e:
+                        logging.error(f"Local index sync failed: {str(e)}")
+            return self._local_index
+
+    def fact_sheets(self):
+        return self.reference_cache.get_or_load(
+            "fact_sheets", lambda: load_fact_sheets(self.session, self.app_db), REFERENCE_TTL
+        )
+
+    def dropdown_data(self):
+        return self.reference_cache.get_or_load(
+            "dropdown_data", lambda: load_dropdown_data(self.session, self.app_db), REFERENCE_TTL
+        )
+
+    def entity_linker(self):
+        return self.reference_cache.get_or_load(
+            "entity_linker", lambda: EntityLinker.from_dropdown(self.dropdown_data()), REFERENCE_TTL
+        )
+
+    def product_names(self):
+        return self.dropdown_data()['PRODUCTNAME'].unique()
+
+    def keep_warm(self):
+        self.session.sql(self.keep_warm_sql).collect()
+
+    def warm_up_tasks(self):
+        """Loads that otherwise fall on the first question, for components.warmup.WarmUp."""
+        tasks = [
+            ("warehouse", self.keep_warm),
+            ("dropdown_data", self.dropdown_data),
+            ("fact_sheets", self.fact_sheets),
+            ("entity_linker", self.entity_linker),
+        ]
+        if self.retrieval_backend != "local":
+            # Resolves the service through Root and opens its connection with one tiny search
+            tasks.append(("search_service", lambda: self.svc.search("warm up", COLUMNS, limit=1)))
+        if self.retrieval_backend == "local" or self.local_index_sync:
+            tasks.append(("local_index", self.local_index))
+        return tasks
+
+    def scope_for(self, site="ALL", pest="ALL", product="ALL"):
+        """Product, pest and site scope for filter values, the same way the sidebar filter cascade resolves them."""
+        if site == "ALL" and pest == "ALL" and product == "ALL":
+            return {"product_list": "ALL", "pest": "ALL", "site": "ALL"}
+        data_df = self.dropdown_data()
+        for column, value in (("SITE", site), ("PEST", pest), ("PRODUCTNAME", product)):
+            if value != "ALL":
+                data_df = data_df[data_df[column] == value]
+        return {
+            "product_list": data_df['PRODUCTNAME'].unique().tolist(),
+            "pest": data_df['PEST'].unique().tolist(),
+            "site": data_df['SITE'].unique().tolist(),
+        }
+
+    def linked_filter(self, text):
+        """Product filter for the names mentioned in text, or None when it names nothing specific enough."""
+        entities = self.entity_linker().link(text)
+        if entities.get("PRODUCTNAME"):
+            products = entities["PRODUCTNAME"]
+        elif entities.get("SITE") or entities.get("PEST"):
+            # The search service only filters on products, pests and sites narrow to their products like the sidebar does
+            data_df = self.dropdown_data()
+            for column in ("SITE", "PEST"):
+                if entities.get(column):
+                    data_df = data_df[data_df[column].isin(entities[column])]
+            products = sorted(data_df['PRODUCTNAME'].unique())
+        else:
+            return None
+        if not products or len(products) > MAX_LINKED_PRODUCTS:
+            return None
+        logging.info(f"Linked entities {entities} to {len(products)} products")
+        return product_filter(list(products))
+
+    def locate(self, location):
+        """Latitude and longitude of a location name from the address list, or (None, None)."""
+        rows = self.session.sql(
+            f"SELECT LATITUDE, LONGITUDE FROM {self.app_db}.MODELED.US_ADDRESS_LIST WHERE LOCATION = ? LIMIT 1",
+            params=[location],
+        ).collect()
+        if not rows:
+            return None, None
+        return rows[0]['LATITUDE'], rows[0]['LONGITUDE']
+
+    ### Upstream calls
+    def complete(self, stage, prompt, user_id=None):
+        # Identical prompts in flight across sessions (e.g. a class asking together) share one Cortex call,
+        # which waits for admission once; each caller's rate limit applies before joining it
+        model = self.stage_models[stage]
+        admission.throttle(user_id)
+        def admitted_complete():
+            with admission.admit("complete", stage):
+                return Complete(model, prompt, session=self.session, timeout=COMPLETE_TIMEOUT)
+        return single_flight.do(prompt_key(model, prompt), admitted_complete)
+
+    def search_chunks(self, query, filter_obj, limit, stage="search", user_id=None):
+        # Same response shape from either backend, the local mirror doubles as a fallback when the service fails
+        if self.retrieval_backend != "local":
+            admission.throttle(user_id)
+            def service_search():
+                with admission.admit("search", stage):
+                    if filter_obj is None:
+                        return json.loads(self.svc.search(query, COLUMNS, limit=limit).json())
+                    return json.loads(self.svc.search(query, COLUMNS, filter=filter_obj, limit=limit).json())
+            try:
+                # Concurrent identical searches share one call, copy so callers can replace the results
+                return dict(single_flight.do(search_key(query, filter_obj, limit), service_search))
+            except AdmissionRejected:
+                # Overload degrades or reaches the user as busy, the mirror's embed call would bypass admission
+                raise
+            except Exception as e:
+                # A mirror that was never synced has nothing to return, do not pay for an embed call on it
+                if not len(self.local_index()):
+                    raise
+                logging.error(f"Cortex Search failed, falling back to local index: {str(e)}")
+        return self.local_index().search(embed_query(self.session, query), COLUMNS, filter=filter_obj, limit=limit)
+
+    def get_presigned_url(self, path):
+        def load_url():
+            cmd2 = f"select GET_PRESIGNED_URL(@{self.ingest_db}.EPA_RAW.PDF_STORE, '{path}', 360) as URL_LINK from directory(@{self.ingest_db}.EPA_RAW.PDF_STORE)"
+            df_url_link = self.session.sql(cmd2).to_pandas()
+            return df_url_link._get_value(0,'URL_LINK')
+        return prefetch.url_cache.get_or_load(path, load_url, URL_TTL)
+
+    def fetch_forecast(self, latitude, longitude):
+        # Fetch every category the app uses once and cache it, questions then pick the categories they need
+        exclude_param = "minutely,alerts"
+        def load_forecast():
+            ow_url = f"http://api.openweathermap.org/data/3.0/onecall?lat={latitude}&lon={longitude}&appid={self.open_weather_api_key}&exclude={exclude_param}&units=imperial"
+            response = requests.request("GET", ow_url, timeout=FORECAST_TIMEOUT)
+            # Error bodies (bad key, rate limited) must not be cached as a forecast
+            response.raise_for_status()
+            return response.json()
+        return prefetch.forecast_cache.get_or_load(
+            (str(latitude), str(longitude)),
+            lambda: single_flight.do(weather_key(latitude, longitude, exclude_param), load_forecast),
+            FORECAST_TTL,
+        )
+
+    def prefetch_product_pool(self, filter_obj):
+        pool = {}
+        for query in PREFETCH_QUERIES:
+            for result in self.search_chunks(query, filter_obj, NUM_CANDIDATES, stage="prefetch").get('results', []):
+                pool.setdefault((result.get('relative_path'), result.get('chunk')), result)
+        prefetch.retrieval_cache.set(pool_key(filter_obj), list(pool.values()), POOL_TTL)
+        for path in {result.get('relative_path') for result in pool.values() if result.get('relative_path')}:
+            self.get_presigned_url(path)
+
+    ### Stages
+    def need_weather(self, question, latitude, longitude, user_id=None):
+        # Returns the spray-window summary when the question needs weather, otherwise None
+        if latitude is None or longitude is None:
+            return None
+        if not parse_yes_no(self.complete("weather", need_weather_prompt(question), user_id)):
+            return None
+        include_categories = self.complete("weather_category", weather_category_prompt(question), user_id)
+        include_categories = parse_weather_categories(include_categories) or list(WEATHER_CATEGORIES)
+
+        # Score spray windows locally and only hand the ranked summary to the LLM
+        return summarize_spray_windows(self.fetch_forecast(latitude, longitude), include_categories)
+
+    def summarize_question_with_history(self, request, question):
+        # To get the right context, use the LLM to first summarize the previous conversation
+        # This will be used to get embeddings and find similar chunks in the docs for context
+        prompt = rewrite_prompt(request["chat_history"], question, request["pest"], request["site"], request["image_analysis"])
+        return self.complete("rewrite", prompt, request["user_id"]).replace("'", "")
+
+    def get_similar_chunks(self, query, filter_obj, num_chunks=NUM_CHUNKS, user_id=None):
+        # Without a sidebar selection, narrow the search to the products the question names
+        linked = False
+        if filter_obj is None and self.entity_linking:
+            filter_obj = self.linked_filter(query)
+            linked = filter_obj is not None
+
+        # The question's own search always runs, a warm product pool only adds candidates or stands in when search fails
+        pool = prefetch.retrieval_cache.get(pool_key(filter_obj)) if filter_obj is not None else None
+        try:
+            json_data = self.search_chunks(query, filter_obj, NUM_CANDIDATES, user_id=user_id)
+        except Exception as e:
+            if not pool:
+                raise
+            logging.warning(f"Search failed, answering from the warm product pool: {str(e)}")
+            json_data = {'results': []}
+
+        if linked:
+            # A wrong link must not cost the answer its context, unfiltered hits join when they name other products
+            try:
+                unfiltered = self.search_chunks(query, None, NUM_CANDIDATES, user_id=user_id).get('results', [])
+            except Exception as e:
+                logging.warning(f"Unfiltered search failed, keeping the linked results: {str(e)}")
+                unfiltered = []
+            if unfiltered and not agrees(json_data.get('results', []), unfiltered, num_chunks):
+                json_data['results'] = merge_results(json_data.get('results', []), unfiltered)
+                pool = None
+
+        if pool:
+            json_data['results'] = merge_results(json_data.get('results', []), pool)
+
+        # Over-retrieve, then keep only the best non-redundant chunks for the prompt
+        json_data['results'] = rerank_chunks(query, json_data.get('results', []), num_chunks)
+        return json_data
+
+    def create_prompt(self, request, weather_forecast, budget):
+        myquestion = request["question"]
+        image_analysis = request["image_analysis"]
+        chat_history = request["chat_history"]
+        if image_analysis is not None:
+            question_with_image = f"{myquestion} <image_analysis>{image_analysis}</image_analysis>"
+        else:
+            question_with_image = myquestion
+
+        if chat_history != []: #There is chat_history, so not first question
+            if needs_history(myquestion, chat_history, self.product_names()):
+                record_rewrite(True)
+                question_summary = budget.run("rewrite", self.summarize_question_with_history, request, question_with_image, fallback=question_with_image)
+            else:
+                record_rewrite(False) #Self-contained follow-up, search with the question as asked
+                question_summary = question_with_image
+            logging.info(f"Query rewrite stats: {get_rewrite_stats()}")
+        else:
+            question_summary = question_with_image #First question when using history
+
+        num_chunks = NUM_CHUNKS
+        if budget.remaining() < ANSWER_RESERVE:
+            num_chunks = DEGRADED_NUM_CHUNKS
+            budget.degrade("context", f"only {DEGRADED_NUM_CHUNKS} chunks used")
+        json_data = budget.run("search", self.get_similar_chunks, question_summary, product_filter(request["product_list"]), num_chunks, request["user_id"])
+
+        prompt = answer_prompt(
+            myquestion, chat_history, json.dumps(json_data), image_analysis, weather_forecast,
+            request["location"], request["pest"], request["site"],
+        )
+        relative_paths = set(item['relative_path'] for item in json_data['results'])
+        return prompt, relative_paths
+
+    def prepare_answer(self, request, budget):
+        # Single-product fact lookups are served from the precomputed fact sheets without RAG
+        fact_answer = budget.run("facts", lookup_facts, request["question"], self.fact_sheets(), request["product_list"])
+        if fact_answer is not None:
+            response, relative_paths = fact_answer
+            return {"source": "fact_sheet", "answer": response, "relative_paths": relative_paths}
+
+        weather_forecast = budget.run("weather", self.need_weather, request["question"], request["latitude"], request["longitude"], request["user_id"], fallback=None)
+        prompt, relative_paths = self.create_prompt(request, weather_forecast, budget)
+        return {"source": "rag", "prompt": prompt, "relative_paths": relative_paths}
+
+    def answer(self, request, budget=None):
+        """Answer one request; stage timings and degraded stages are recorded on the budget."""
+        budget = budget or TurnBudget(float("inf"), {})
+        prepared = self.prepare_answer(request, budget)
+        if prepared["source"] == "rag":
+            response = budget.run("answer", self.complete, "answer", prepared["prompt"], request["user_id"])
+        else:
+            response = prepared["answer"]
+
+        return {
+            "answer": response.replace("'", ""),
+            "relative_paths": sorted(prepared["relative_paths"]),
+            "source": prepared["source"],
+            "timings": budget.timings,
+            "degraded": budget.degraded,
+        }
+
+    def answer_stream(self, request, budget=None):
+        """Answer one request as events: the source documents, answer text deltas, then timings and degraded stages."""
+        budget = budget or TurnBudget(float("inf"), {})
+        prepared = self.prepare_answer(request, budget)
+        yield {"event": "sources", "source": prepared["source"], "relative_paths": sorted(prepared["relative_paths"])}
+
+        if prepared["source"] == "rag":
+            # Streamed answers are not shared through single-flight, each caller reads its own token stream
+            started = time.monotonic()
+            model = self.stage_models["answer"]
+            # The slot is held until the stream ends or the client goes away and the generator is closed
+            with admission.admit("complete", "answer", request["user_id"]):
+                for delta in Complete(model, prepared["prompt"], session=self.session, stream=True, timeout=COMPLETE_TIMEOUT):
+                    yield {"event": "delta", "text": delta.replace("'", "")}
+            budget.timings["answer"] = round(time.monotonic() - started, 2)
+        else:
+            yield {"event": "delta", "text": prepared["answer"].replace("'", "")}
+
+        yield {"event": "done", "timings": budget.timings, "degraded": budget.degraded}
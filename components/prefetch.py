@@ -0,0 +1,105 @@
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+PREFETCH_WORKERS = 4
+
+
+class TTLCache:
+    """Small thread-safe cache whose entries expire after a per-entry time to live."""
+
+    def __init__(self, max_entries=512):
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.max_entries = max_entries
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.time():
+                del self.entries[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            if len(self.entries) >= self.max_entries:
+                # Drop the entry closest to expiry to make room
+                del self.entries[min(self.entries, key=lambda k: self.entries[k][0])]
+            self.entries[key] = (time.time() + ttl, value)
+
+    def get_or_load(self, key, loader, ttl):
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            self.set(key, value, ttl)
+        return value
+
+
+class SharedTTLCache(TTLCache):
+    """TTLCache kept in a SQLite file, so every worker process on a host reads what any of them loaded."""
+
+    def __init__(self, path, table, max_entries=4096):
+        self.lock = threading.Lock()
+        self.table = table
+        self.max_entries = max_entries
+        self.db = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(f"CREATE TABLE IF NOT EXISTS {table} (KEY TEXT PRIMARY KEY, EXPIRES REAL, VALUE BLOB)")
+        self.db.commit()
+
+    def get(self, key):
+        with self.lock:
+            row = self.db.execute(
+                f"SELECT VALUE FROM {self.table} WHERE KEY = ? AND EXPIRES >= ?", (repr(key), time.time())
+            ).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                f"INSERT OR REPLACE INTO {self.table} (KEY, EXPIRES, VALUE) VALUES (?, ?, ?)",
+                (repr(key), now + ttl, pickle.dumps(value)),
+            )
+            # Expired entries go first, then the ones closest to expiry
+            self.db.execute(f"DELETE FROM {self.table} WHERE EXPIRES < ?", (now,))
+            self.db.execute(
+                f"DELETE FROM {self.table} WHERE KEY NOT IN (SELECT KEY FROM {self.table} ORDER BY EXPIRES DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            self.db.commit()
+
+
+# Process-wide caches warmed in the background and read by the chat flow
+retrieval_cache = TTLCache()
+url_cache = TTLCache()
+forecast_cache = TTLCache()
+
+
+def use_shared_caches(path):
+    """Back the retrieval, URL and forecast caches with one SQLite file shared by all worker processes."""
+    global retrieval_cache, url_cache, forecast_cache
+    retrieval_cache = SharedTTLCache(path, "RETRIEVAL_CACHE")
+    url_cache = SharedTTLCache(path, "URL_CACHE")
+    forecast_cache = SharedTTLCache(path, "FORECAST_CACHE")
+
+_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+
+
+def _run(name, fn, *args):
+    try:
+        fn(*args)
+    except Exception as e:
+        # Prefetch is speculative, the chat flow fetches anything that failed here
+        logging.warning(f"Prefetch {name} failed: {str(e)}")
+
+
+def submit(name, fn, *args):
+    return _executor.submit(_run, name, fn, *args)
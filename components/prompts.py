@@ -0,0 +1,148 @@
+import re
+
+WEATHER_CATEGORIES = ("current", "hourly", "daily")
+
+WEATHER_LABELS = """
+              [{
+                'label': 'current',
+                'description': 'weather related to current/present time',
+                'examples': ['is today a good day?', 'can I do it now?', 'is the current weather okay?']
+            },{
+                'label': 'hourly',
+                'description': 'Weather focus in next few hours',
+                'examples': ['when should I start today?', 'Can I do in next n hours?']
+                },{
+                'label': 'daily',
+                'description': 'Weather focussed only on current day or future?',
+                'examples': ['is today a good day?', 'Can I do tomorrow?' , 'Would this week be better?']
+                }]
+        """
+
+
+def need_weather_prompt(question):
+    return f"""
+    Analyze the text/question within the tag <question> and </question>. Does this question expects a current or future time/day/weather related context?
+    If the question has or expects time/days related context, reply with "Yes" otherwise reply with "No".
+
+    <question>
+    {question}
+    </question>
+    """
+
+
+def weather_category_prompt(question):
+    return f"""
+        Based on the question or the text within the tag <weather_forecast> and </weather_forecast>,
+        answer which among the following labels between the tag <labels> and </labels> would be suitable to look in weather forecast options?
+
+
+        <weather_forecast>
+        {question}
+        </weather_forecast>
+
+        <labels>
+        {WEATHER_LABELS}
+        </labels>
+
+        Reply with ONLY the labels and nothing else.
+        """
+
+
+def rewrite_prompt(chat_history, question, pest="ALL", site="ALL", image_analysis=None):
+    prompt = f"""
+    Based on the chat history below and the question, generate a query that extends the question
+    with the chat history provided. The query should be in natural language.
+    Answer with only the query. Do not add any explanation.
+
+    <chat_history>
+    {chat_history}
+    </chat_history>
+
+    <question>
+    {question}
+    </question>
+    """
+
+    if pest != "ALL" or site != "ALL":
+        prompt = f"""{prompt}
+            <pest_in_scope>
+            {pest}
+            </pest_in_scope>
+
+            <site_in_scope>
+            {site}
+            </site_in_scope>
+            """
+
+    if image_analysis is not None:
+        prompt = f"{prompt} <image_analysis> {image_analysis} </image_analysis>"
+    return prompt
+
+
+def answer_prompt(question, chat_history, context, image_analysis, weather_forecast, location, pest="ALL", site="ALL"):
+    base_answer_prompt = f"""
+           You are an agronomist who can advise on pesticides. 
+           
+           When the question is general about a product, you advice on topics such as pesticide's labeling and usage. You can speak about the active ingredient, 
+           dosage, relevant crop/plant, PPE needed, Environment hazards, mode of action, target pest. 
+            
+           You can utilize the information contained from the CONTEXT provided
+           between <context> and </context> tags.
+           
+           You can utilize the information contained from the IMAGE ANALYSIS provided
+           between <image_analysis> and </image_analysis> tags.
+
+            You can utilize the weather information contained for location ({location}) within
+           between <weather_forecast> and </weather_forecast> tags if needed. The weather information is in imperial units
+           and is already scored for spray suitability, with the best hourly windows and days ranked first.
+
+           You offer a chat experience considering the information included in the CHAT HISTORY
+           provided between <chat_history> and </chat_history> tags..
+           When answering the question contained between <question> and </question> tags
+           be a bit detailed and please DO NOT HALLUCINATE. 
+           If you don´t have the information, say you do not have enough information to answer.
+           
+           Do not mention the CONTEXT used in your answer.
+           Do not mention the CHAT HISTORY used in your answer.
+           Do not repeat the CHAT HISTORY again in your answer.
+           Only answer the question if you can extract it from the CONTEXT provided.
+           
+           <chat_history>
+           {chat_history}
+           </chat_history>
+           <context>          
+           {context}
+           </context>
+           <image_analysis>
+           {image_analysis}
+           </image_analysis>
+           <weather_forecast>
+           {weather_forecast}
+           </weather_forecast>
+           <question>  
+           {question}
+           </question>
+           """
+    answer = "Answer:"
+    if pest == "ALL" and site == "ALL":
+        return f"{base_answer_prompt} {answer}"
+    extra_details = f"""
+            <pest_in_scope>
+            {pest}
+            </pest_in_scope>
+
+            <site_in_scope>
+            {site}
+            </site_in_scope>
+            """
+    return f"{extra_details}{base_answer_prompt} {answer}"
+
+
+def parse_yes_no(text):
+    # Small models often answer "Yes." or "Yes, because ..."
+    return text.strip().strip("\"'").lower().startswith("yes")
+
+
+def parse_weather_categories(text):
+    lowered = text.lower()
+    return [category for category in WEATHER_CATEGORIES if re.search(rf"\b{category}\b", lowered)]
@@ -0,0 +1,102 @@
+import re
+import threading
+
+from components.entity_linking import is_distinctive
+
+# Words that only make sense with an antecedent from an earlier turn
+REFERENCE_WORDS = {
+    "it", "its", "it's", "this", "that", "these", "those", "they", "them", "their",
+    "theirs", "he", "she", "same", "above", "previous", "former", "latter",
+}
+
+# Openers that continue the previous question instead of asking a new one
+ELLIPSIS_PREFIXES = (
+    "what about", "how about", "and ", "also ", "what if", "and what", "same for",
+    "why", "how come", "ok ", "okay ", "so ", "then ", "more ", "tell me more",
+)
+
+STOP_WORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "to", "of", "for", "on", "in",
+    "at", "by", "with", "and", "or", "can", "i", "my", "me", "do", "does", "what",
+    "which", "how", "when", "should", "would", "could", "will", "use", "about",
+    "there", "then", "one", "other", "else",
+}
+
+MIN_CONTENT_WORDS = 3
+PREVIOUS_TURN_SIMILARITY = 0.5
+
+_stats_lock = threading.Lock()
+_stats = {"rewritten": 0, "bypassed": 0}
+
+
+def tokenize(text):
+    return re.findall(r"[a-z0-9][a-z0-9'\-]*", text.lower())
+
+
+def content_words(tokens):
+    return {token for token in tokens if token not in STOP_WORDS and token not in REFERENCE_WORDS}
+
+
+def word_sequence(text):
+    # Padded so a name only matches whole words, "ACE" must not match "surface"
+    return f" {' '.join(re.findall(r'[a-z0-9]+', str(text).lower()))} "
+
+
+def mentions_product(question, product_names):
+    words = word_sequence(question)
+    for name in product_names:
+        # A single ordinary word like "out" or "max" is no sign the question names its own product
+        if is_distinctive(name) and word_sequence(name) in words:
+            return True
+    return False
+
+
+def previous_user_question(chat_history):
+    for message in reversed(chat_history):
+        if message.get("role") == "user":
+            return message.get("content", "")
+    return ""
+
+
+def needs_history(question, chat_history, product_names=()):
+    """Cheap local check for whether the question depends on earlier turns."""
+    if not chat_history:
+        return False
+
+    lowered = question.lower().strip()
+    tokens = tokenize(lowered)
+    has_reference = any(token in REFERENCE_WORDS for token in tokens)
+    has_ellipsis = lowered.startswith(ELLIPSIS_PREFIXES)
+
+    # Pointing back wins even when a product is named, "Can I mix Sevin with it?"
+    if has_reference or has_ellipsis:
+        return True
+    # Otherwise a question that names its own product stands on its own
+    if mentions_product(question, product_names):
+        return False
+
+    words = content_words(tokens)
+    if len(words) < MIN_CONTENT_WORDS:
+        return True
+
+    # Mostly repeating the previous question's terms means it refines that question
+    previous_words = content_words(tokenize(previous_user_question(chat_history)))
+    if previous_words:
+        overlap = len(words & previous_words) / len(words | previous_words)
+        if overlap >= PREVIOUS_TURN_SIMILARITY:
+            return True
+
+    return False
+
+
+def record_rewrite(rewritten):
+    with _stats_lock:
+        _stats["rewritten" if rewritten else "bypassed"] += 1
+
+
+def get_rewrite_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    total = stats["rewritten"] + stats["bypassed"]
+    stats["bypass_rate"] = stats["bypassed"] / total if total else 0.0
+    return stats
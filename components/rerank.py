@@ -0,0 +1,112 @@
+import math
+import re
+from collections import Counter
+
+# Weight of each column in the lightweight cross-scorer; set a weight to 0 to ignore that column
+FIELD_WEIGHTS = {
+    "chunk": 1.0,
+    "PRODUCTNAME": 2.0,
+    "SIGNAL_WORD": 0.5,
+}
+BM25_WEIGHT = 1.0
+SERVICE_RANK_WEIGHT = 0.3
+REDUNDANCY_THRESHOLD = 0.8
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def tokenize(text):
+    return re.findall(r"[a-z0-9]+", str(text or "").lower())
+
+
+def bm25_scores(query_tokens, documents, k1=BM25_K1, b=BM25_B):
+    """BM25 score of the query against each tokenized document, with idf taken from the candidate set."""
+    if not documents:
+        return []
+    doc_count = len(documents)
+    avg_len = sum(len(doc) for doc in documents) / doc_count or 1.0
+    doc_freq = Counter(token for doc in documents for token in set(doc))
+    query_terms = set(query_tokens)
+
+    scores = []
+    for doc in documents:
+        term_freq = Counter(doc)
+        score = 0.0
+        for term in query_terms:
+            freq = term_freq.get(term, 0)
+            if not freq:
+                continue
+            idf = math.log(1 + (doc_count - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+            score += idf * freq * (k1 + 1) / (freq + k1 * (1 - b + b * len(doc) / avg_len))
+        scores.append(score)
+    return scores
+
+
+def field_score(query_tokens, result, field_weights=FIELD_WEIGHTS):
+    """Share of each column's terms found in the query, weighted per column."""
+    query_terms = set(query_tokens)
+    score = 0.0
+    for field, weight in field_weights.items():
+        if not weight:
+            continue
+        field_terms = set(tokenize(result.get(field)))
+        if field_terms:
+            score += weight * len(field_terms & query_terms) / len(field_terms)
+    return score
+
+
+def shingles(tokens, size=3):
+    return {tuple(tokens[i:i + size]) for i in range(max(1, len(tokens) - size + 1))}
+
+
+def is_redundant(candidate, kept, threshold=REDUNDANCY_THRESHOLD):
+    for other in kept:
+        union = candidate | other
+        if union and len(candidate & other) / len(union) >= threshold:
+            return True
+    return False
+
+
+def rerank_chunks(query, results, top_k, field_weights=FIELD_WEIGHTS, redundancy_threshold=REDUNDANCY_THRESHOLD):
+    """Rerank search results locally and keep the top_k non-redundant chunks."""
+    if not results:
+        return []
+    query_tokens = tokenize(query)
+    chunk_tokens = [tokenize(result.get("chunk")) for result in results]
+
+    lexical = bm25_scores(query_tokens, chunk_tokens)
+    max_lexical = max(lexical) or 1.0
+
+    scored = []
+    for rank, result in enumerate(results):
+        score = (
+            BM25_WEIGHT * lexical[rank] / max_lexical
+            + field_score(query_tokens, result, field_weights)
+            + SERVICE_RANK_WEIGHT / (1 + rank)
+        )
+        scored.append((score, rank))
+    scored.sort(key=lambda item: (-item[0], item[1]))
+
+    selected = []
+    kept_shingles = []
+    for _, rank in scored:
+        candidate = shingles(chunk_tokens[rank])
+        if is_redundant(candidate, kept_shingles, redundancy_threshold):
+            continue
+        selected.append(results[rank])
+        kept_shingles.append(candidate)
+        if len(selected) == top_k:
+            break
+    return selected
+
+
+def merge_results(results, extra):
+    """Results followed by the extra ones not already among them, by (relative_path, chunk)."""
+    seen = {(result.get("relative_path"), result.get("chunk")) for result in results}
+    return results + [result for result in extra if (result.get("relative_path"), result.get("chunk")) not in seen]
+
+
+def agrees(linked_results, unfiltered_results, top_k):
+    """Whether an unfiltered search's top_k hits include any product the linked search returned."""
+    linked_products = {result.get("PRODUCTNAME") for result in linked_results}
+    return any(result.get("PRODUCTNAME") in linked_products for result in unfiltered_results[:top_k])
@@ -0,0 +1,70 @@
+import hashlib
+import json
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one upstream call whose result all callers share."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.stats = {"leaders": 0, "shared": 0}
+
+    def do(self, key, fn, *args, **kwargs):
+        with self.lock:
+            call = self.calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.stats["shared"] += 1
+                leader = False
+            else:
+                call = self.calls[key] = _Call()
+                self.stats["leaders"] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            # Only in-flight calls are shared, the next identical call after this one goes upstream again
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+    def get_stats(self):
+        with self.lock:
+            return {**self.stats, "in_flight": len(self.calls)}
+
+
+def prompt_key(model, prompt):
+    return ("complete", model, hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+
+
+def search_key(query, filter_obj, limit):
+    return ("search", query, json.dumps(filter_obj, sort_keys=True), limit)
+
+
+def weather_key(latitude, longitude, exclude):
+    return ("weather", str(latitude), str(longitude), exclude)
+
+
+# Process-wide, shared by every Streamlit session in this server
+single_flight = SingleFlight()
@@ -0,0 +1,170 @@
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Spray-suitability thresholds, OpenWeather imperial units (°F, mph, %)
+MIN_WIND_MPH = 3.0 # below this, temperature inversions can carry fine droplets off target
+MAX_WIND_MPH = 10.0 # above this, drift risk
+MAX_GUST_MPH = 15.0
+MIN_TEMP_F = 40.0
+MAX_TEMP_F = 85.0
+MIN_HUMIDITY = 40.0 # drier air evaporates droplets before they land
+MAX_RAIN_PROB = 0.3
+RAINFAST_HOURS = 4 # hours after spraying that should stay dry
+MIN_SCORE = 75.0 # any drift, inversion, temperature or rain risk alone drops an hour below this
+TOP_WINDOWS = 3
+
+PENALTIES = {
+    "drift": 40.0,
+    "inversion": 30.0,
+    "gusts": 20.0,
+    "temperature": 25.0,
+    "humidity": 15.0,
+    "rain": 40.0,
+}
+
+
+def column(records, key, default=0.0):
+    return np.array([default if record.get(key) is None else record[key] for record in records], dtype=float)
+
+
+def rain_amount(records):
+    # Hourly/current rain is {"1h": mm}, daily rain is a plain number
+    amounts = []
+    for record in records:
+        rain = record.get("rain") or 0.0
+        amounts.append(rain.get("1h", 0.0) if isinstance(rain, dict) else rain)
+    return np.array(amounts, dtype=float)
+
+
+def score_conditions(wind, gust, temp, humidity, rain_prob, rain):
+    """Score every record in one pass; returns (score, flags) where flags maps each risk to a boolean array."""
+    flags = {
+        "drift": wind > MAX_WIND_MPH,
+        "inversion": wind < MIN_WIND_MPH,
+        "gusts": gust > MAX_GUST_MPH,
+        "temperature": (temp < MIN_TEMP_F) | (temp > MAX_TEMP_F),
+        "humidity": humidity < MIN_HUMIDITY,
+        "rain": (rain_prob > MAX_RAIN_PROB) | (rain > 0),
+    }
+    score = 100.0 - sum(PENALTIES[name] * flag for name, flag in flags.items())
+    return np.clip(score, 0.0, 100.0), flags
+
+
+def describe_risks(flags, index):
+    risks = [name for name, flag in flags.items() if np.any(flag[index])]
+    return ", ".join(risks) if risks else "none"
+
+
+def format_time(timestamp, offset, pattern):
+    return datetime.fromtimestamp(int(timestamp) + offset, tz=timezone.utc).strftime(pattern)
+
+
+def hourly_windows(hourly, offset):
+    """Contiguous runs of sprayable hours that also stay dry for RAINFAST_HOURS afterwards, best first."""
+    if not hourly:
+        return []
+    dt = column(hourly, "dt")
+    wind = column(hourly, "wind_speed")
+    gust = column(hourly, "wind_gust")
+    gust = np.where(gust > 0, gust, wind)
+    temp = column(hourly, "temp")
+    humidity = column(hourly, "humidity", 100.0)
+    rain_prob = column(hourly, "pop")
+    rain = rain_amount(hourly)
+
+    score, flags = score_conditions(wind, gust, temp, humidity, rain_prob, rain)
+
+    # Rain in the hours right after application washes product off, look ahead over a sliding window
+    wet = flags["rain"].astype(float)
+    padded = np.concatenate([wet, np.zeros(RAINFAST_HOURS)])
+    rain_ahead = np.lib.stride_tricks.sliding_window_view(padded[1:], RAINFAST_HOURS)[: len(wet)].max(axis=1) > 0
+    score = np.where(rain_ahead, np.maximum(score - PENALTIES["rain"], 0.0), score)
+
+    good = score >= MIN_SCORE
+    edges = np.diff(np.concatenate([[0], good.astype(int), [0]]))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    windows = []
+    for start, end in zip(starts, ends):
+        span = slice(start, end)
+        windows.append({
+            "start": format_time(dt[start], offset, "%a %Y-%m-%d %H:00"),
+            "end": format_time(dt[end - 1] + 3600, offset, "%a %Y-%m-%d %H:00"),
+            "hours": int(end - start),
+            "avg_score": round(float(score[span].mean()), 1),
+            "wind_mph": f"{wind[span].min():.0f}-{wind[span].max():.0f}",
+            "temp_f": f"{temp[span].min():.0f}-{temp[span].max():.0f}",
+            "min_humidity": int(humidity[span].min()),
+            "max_rain_prob": round(float(rain_prob[span].max()), 2),
+        })
+    windows.sort(key=lambda window: (-window["avg_score"], -window["hours"]))
+    return windows[:TOP_WINDOWS]
+
+
+def daily_ranking(daily, offset):
+    if not daily:
+        return []
+    dt = column(daily, "dt")
+    wind = column(daily, "wind_speed")
+    gust = column(daily, "wind_gust")
+    gust = np.where(gust > 0, gust, wind)
+    temp_max = np.array([(day.get("temp") or {}).get("max", 0.0) for day in daily], dtype=float)
+    temp_min = np.array([(day.get("temp") or {}).get("min", 0.0) for day in daily], dtype=float)
+    humidity = column(daily, "humidity", 100.0)
+    rain_prob = column(daily, "pop")
+    rain = rain_amount(daily)
+
+    # The daily max is what matters for volatility, the daily min for a cold morning
+    score, flags = score_conditions(wind, gust, temp_max, humidity, rain_prob, rain)
+    cold = temp_min < MIN_TEMP_F
+    score = np.clip(score - np.where(cold & ~flags["temperature"], PENALTIES["temperature"] / 2, 0.0), 0.0, 100.0)
+
+    order = np.argsort(-score, kind="stable")[:TOP_WINDOWS]
+    return [
+        {
+            "date": format_time(dt[i], offset, "%a %Y-%m-%d"),
+            "score": round(float(score[i]), 1),
+            "wind_mph": round(float(wind[i]), 1),
+            "temp_f": f"{temp_min[i]:.0f}-{temp_max[i]:.0f}",
+            "humidity": int(humidity[i]),
+            "rain_prob": round(float(rain_prob[i]), 2),
+            "risks": describe_risks(flags, i),
+        }
+        for i in order
+    ]
+
+
+def current_conditions(current):
+    wind = np.array([current.get("wind_speed", 0.0)], dtype=float)
+    gust = np.array([current.get("wind_gust") or current.get("wind_speed", 0.0)], dtype=float)
+    temp = np.array([current.get("temp", 0.0)], dtype=float)
+    humidity = np.array([current.get("humidity", 100.0)], dtype=float)
+    rain = rain_amount([current])
+    score, flags = score_conditions(wind, gust, temp, humidity, np.zeros(1), rain)
+    return {
+        "score": round(float(score[0]), 1),
+        "suitable_now": bool(score[0] >= MIN_SCORE),
+        "wind_mph": round(float(wind[0]), 1),
+        "temp_f": round(float(temp[0]), 1),
+        "humidity": int(humidity[0]),
+        "risks": describe_risks(flags, 0),
+    }
+
+
+def summarize_spray_windows(data, include_categories=("current", "hourly", "daily")):
+    """Compact ranked spray-suitability summary of a One Call forecast, for use in the answer prompt."""
+    offset = int(data.get("timezone_offset", 0))
+    summary = {
+        "thresholds": f"wind {MIN_WIND_MPH:.0f}-{MAX_WIND_MPH:.0f} mph, gusts <= {MAX_GUST_MPH:.0f} mph, "
+                      f"temp {MIN_TEMP_F:.0f}-{MAX_TEMP_F:.0f} F, humidity >= {MIN_HUMIDITY:.0f}%, "
+                      f"rain chance <= {MAX_RAIN_PROB:.0%} and dry for {RAINFAST_HOURS}h after",
+    }
+    if "current" in include_categories and "current" in data:
+        summary["current"] = current_conditions(data["current"])
+    if "hourly" in include_categories and "hourly" in data:
+        summary["best_hourly_windows"] = hourly_windows(data["hourly"], offset)
+    if "daily" in include_categories and "daily" in data:
+        summary["best_days"] = daily_ranking(data["daily"], offset)
+    return summary
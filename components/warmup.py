@@ -0,0 +1,96 @@
+import datetime
+import logging
+import threading
+import time
+from zoneinfo import ZoneInfo
+
+KEEP_WARM_INTERVAL = 240 # seconds between keep-warm queries, under the warehouse auto-suspend
+BUSINESS_HOURS = (6, 20) # local start and end hour when growers use the app
+BUSINESS_TIMEZONE = "America/Chicago"
+
+# RANDOM() keeps the result cache from answering it, so the query reaches the warehouse and resumes it
+KEEP_WARM_SQL = "SELECT RANDOM() FROM {table} LIMIT 1"
+
+
+def keep_warm_sql(table):
+    return KEEP_WARM_SQL.format(table=table)
+
+
+class WarmUp:
+    """Loads shared resources in the background at process start, then keeps the warehouse resumed during business hours.
+
+    Settings come from the [warm_up] secrets table: keep_warm_interval, business_hours and timezone.
+    """
+
+    def __init__(self, tasks, keep_warm=None, settings=None):
+        settings = settings or {}
+        self.tasks = tasks # (name, fn) pairs, run in order
+        self.keep_warm = keep_warm
+        self.interval = settings.get("keep_warm_interval", KEEP_WARM_INTERVAL)
+        self.business_hours = tuple(settings.get("business_hours", BUSINESS_HOURS))
+        self.timezone = ZoneInfo(settings.get("timezone", BUSINESS_TIMEZONE))
+        self.lock = threading.Lock()
+        self.status = {name: {"state": "pending"} for name, _ in tasks}
+        self.keep_warm_status = {"runs": 0, "last_run": None, "last_error": None}
+        self.stopped = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self.run, name="warm-up", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        started = time.monotonic()
+        for name, fn in self.tasks:
+            with self.lock:
+                self.status[name] = {"state": "running"}
+            task_started = time.monotonic()
+            try:
+                fn()
+                state = {"state": "ready"}
+            except Exception as e:
+                logging.error(f"Warm-up {name} failed: {str(e)}")
+                state = {"state": "failed", "error": str(e)}
+            with self.lock:
+                self.status[name] = {**state, "seconds": round(time.monotonic() - task_started, 2)}
+        logging.info(f"Warm-up finished in {time.monotonic() - started:.1f}s: {self.get_status()}")
+
+        if self.keep_warm is not None:
+            self.keep_warm_loop()
+
+    def in_business_hours(self, now=None):
+        now = now or datetime.datetime.now(self.timezone)
+        start, end = self.business_hours
+        return start <= now.hour < end
+
+    def keep_warm_loop(self):
+        # Warm-up itself just ran queries, so the first keep-warm waits one interval
+        while not self.stopped.wait(self.interval):
+            if not self.in_business_hours():
+                continue
+            try:
+                self.keep_warm()
+                error = None
+            except Exception as e:
+                logging.warning(f"Keep-warm query failed: {str(e)}")
+                error = str(e)
+            with self.lock:
+                self.keep_warm_status = {
+                    "runs": self.keep_warm_status["runs"] + 1,
+                    "last_run": datetime.datetime.now(self.timezone).isoformat(timespec="seconds"),
+                    "last_error": error,
+                }
+
+    def ready(self):
+        with self.lock:
+            return all(status["state"] == "ready" for status in self.status.values())
+
+    def get_status(self):
+        with self.lock:
+            return {
+                "ready": all(status["state"] == "ready" for status in self.status.values()),
+                "tasks": {name: dict(status) for name, status in self.status.items()},
+                "keep_warm": dict(self.keep_warm_status),
+            }
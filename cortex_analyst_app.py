@@ -1,3 +1,5 @@
+import logging
+import uuid
 from typing import Any, Dict, List, Optional
 
 import pandas as pd
@@ -8,11 +10,18 @@ import yaml
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.backends import default_backend
 
+from components.admission import AdmissionRejected, admission
+from components.warmup import WarmUp, keep_warm_sql
+
 HOST = "gmcpdcz-mt01740.snowflakecomputing.com"
 DATABASE = "DEV_SRC_INGEST"
 SCHEMA = "EPA_RAW"
 STAGE = "CORTEX_ANALYST"
 FILE = "epa_analyst.yaml"
+SQL_POLL_SECONDS = 1
+SQL_RESULTS_TTL = 3600 # seconds a fetched result stays cached for redraws
+SQL_RESULTS_MAX_ENTRIES = 100
+BUSY_MESSAGE = "Kronia Analyst is answering a lot of questions right now, please try again in a moment."
 
 p_key_str = st.secrets["private_key_file"]
 p_key_bytes = p_key_str.encode('utf-8')
@@ -22,8 +31,8 @@ p_key = serialization.load_pem_private_key(
             backend=default_backend()
         )
 
-if 'CONN' not in st.session_state or st.session_state.CONN is None:
-    st.session_state.CONN = snowflake.connector.connect(
+def connect() -> snowflake.connector.SnowflakeConnection:
+    return snowflake.connector.connect(
         user=st.secrets["user"],
         password=st.secrets["password"],
         account=st.secrets["account"],
@@ -35,13 +44,31 @@ if 'CONN' not in st.session_state or st.session_state.CONN is None:
 
     )
 
+
+@st.cache_resource
+def get_shared_connection() -> snowflake.connector.SnowflakeConnection:
+    """One connection per process for loads shared by every session: the semantic model and keep-warm queries."""
+    return connect()
+
+
+if 'CONN' not in st.session_state or st.session_state.CONN is None:
+    st.session_state.CONN = connect()
+
+@st.cache_resource
+def configure_admission() -> None:
+    """Applies the [admission] secrets once per process, the limits are shared with every session."""
+    admission.configure(st.secrets.get("admission", {}))
+
+
+configure_admission()
+
 st.set_page_config(page_title="Kronia Analyst", page_icon="🌾", layout="wide", initial_sidebar_state="auto", menu_items=None)
 
 @st.cache_data
 def get_semantic_model_content() -> Dict[str, Any]:
     """Fetches and parses the semantic model YAML file from Snowflake stage."""
     try:
-        cursor = st.session_state.CONN.cursor()
+        cursor = get_shared_connection().cursor()
         cursor.execute(f"SELECT $1 FROM @{DATABASE}.{SCHEMA}.{STAGE}/{FILE}")
         result = cursor.fetchall()
         cursor.close()
@@ -60,20 +87,59 @@ def get_semantic_model_content() -> Dict[str, Any]:
         return {}
 
 
+def load_semantic_model() -> None:
+    """Warm-up task, clears a failed load so the next session retries it."""
+    if not get_semantic_model_content():
+        get_semantic_model_content.clear()
+        raise RuntimeError("semantic model is empty or could not be read")
+
+
+def keep_warehouse_warm() -> None:
+    """Keep-warm query against the semantic model's first table, or the warm_up.analyst_keep_warm_query secret."""
+    query = st.secrets.get("warm_up", {}).get("analyst_keep_warm_query")
+    if query is None:
+        base_table = (get_semantic_model_content().get("tables") or [{}])[0].get("base_table", {})
+        if not base_table:
+            return
+        query = keep_warm_sql(f"{base_table['database']}.{base_table['schema']}.{base_table['table']}")
+    cursor = get_shared_connection().cursor()
+    try:
+        cursor.execute(query)
+    finally:
+        cursor.close()
+
+
+@st.cache_resource
+def start_warm_up() -> WarmUp:
+    """Starts once per process, on the first run, and keeps running for later sessions."""
+    tasks = [("semantic_model", load_semantic_model), ("warehouse", keep_warehouse_warm)]
+    return WarmUp(tasks, keep_warehouse_warm, st.secrets.get("warm_up", {})).start()
+
+
+def rate_limit_id() -> str:
+    """The signed-in user, or this browser session for visitors who are not signed in."""
+    if st.experimental_user.email:
+        return st.experimental_user.email
+    if "rate_limit_id" not in st.session_state:
+        st.session_state.rate_limit_id = str(uuid.uuid4())
+    return st.session_state.rate_limit_id
+
+
 def send_message(prompt: str) -> Dict[str, Any]:
     """Calls the REST API and returns the response."""
     request_body = {
         "messages": [{"role": "user", "content": [{"type": "text", "text": prompt}]}],
         "semantic_model_file": f"@{DATABASE}.{SCHEMA}.{STAGE}/{FILE}",
     }
-    resp = requests.post(
-        url=f"https://{HOST}/api/v2/cortex/analyst/message",
-        json=request_body,
-        headers={
-            "Authorization": f'Snowflake Token="{st.session_state.CONN.rest.token}"',
-            "Content-Type": "application/json",
-        },
-    )
+    with admission.admit("analyst", "analyst", rate_limit_id()):
+        resp = requests.post(
+            url=f"https://{HOST}/api/v2/cortex/analyst/message",
+            json=request_body,
+            headers={
+                "Authorization": f'Snowflake Token="{st.session_state.CONN.rest.token}"',
+                "Content-Type": "application/json",
+            },
+        )
     request_id = resp.headers.get("X-Snowflake-Request-Id")
     if resp.status_code < 400:
         return {**resp.json(), "request_id": request_id}  # type: ignore[arg-type]
@@ -83,16 +149,76 @@ def send_message(prompt: str) -> Dict[str, Any]:
         )
 
 
+def submit_sql(statement: str) -> str:
+    """Starts a statement asynchronously and returns its query ID."""
+    cursor = st.session_state.CONN.cursor()
+    cursor.execute_async(statement)
+    query_id = cursor.sfqid
+    cursor.close()
+    st.session_state.running_queries.add(query_id)
+    return query_id
+
+
+def cancel_sql(query_id: str) -> None:
+    """Cancels a running query by ID."""
+    cursor = st.session_state.CONN.cursor()
+    try:
+        cursor.execute(f"SELECT SYSTEM$CANCEL_QUERY('{query_id}')")
+    finally:
+        cursor.close()
+    st.session_state.running_queries.discard(query_id)
+
+
+def cancel_running_queries() -> None:
+    """Cancels queries still running for earlier messages once the user moves on."""
+    for query_id in list(st.session_state.running_queries):
+        if is_sql_running(query_id):
+            cancel_sql(query_id)
+        st.session_state.running_queries.discard(query_id)
+
+
+def is_sql_running(query_id: str) -> bool:
+    """Checks the query status without waiting for it."""
+    return st.session_state.CONN.is_still_running(
+        st.session_state.CONN.get_query_status(query_id)
+    )
+
+
+@st.cache_data(show_spinner=False, ttl=SQL_RESULTS_TTL, max_entries=SQL_RESULTS_MAX_ENTRIES)
+def fetch_sql_results(query_id: str) -> pd.DataFrame:
+    """Fetches the results of a finished query by ID instead of re-running it."""
+    cursor = st.session_state.CONN.cursor()
+    try:
+        cursor.get_results_from_sfqid(query_id)
+        rows = cursor.fetchall()
+        return pd.DataFrame(rows, columns=[column[0] for column in cursor.description])
+    finally:
+        cursor.close()
+
+
 def process_message(prompt: str) -> None:
     """Processes a message and adds the response to the chat."""
+    cancel_running_queries()
     st.session_state.messages.append(
         {"role": "user", "content": [{"type": "text", "text": prompt}]}
     )
     
     with st.spinner("Generating response..."):
-        response = send_message(prompt=prompt)
+        try:
+            response = send_message(prompt=prompt)
+        except AdmissionRejected as e:
+            logging.warning(f"Analyst request not admitted: {str(e)}")
+            st.session_state.messages.append(
+                {"role": "assistant", "content": [{"type": "text", "text": BUSY_MESSAGE}]}
+            )
+            return
         request_id = response["request_id"]
         content = response["message"]["content"]
+
+    # Start SQL as soon as it arrives so it runs while the page renders
+    for item in content:
+        if item["type"] == "sql":
+            item["query_id"] = submit_sql(item["statement"])
     
     st.session_state.messages.append(
         {"role": "assistant", "content": content, "request_id": request_id}
@@ -109,7 +235,7 @@ def display_content(
     if request_id:
         with st.expander("Request ID", expanded=False):
             st.markdown(request_id)
-    for item in content:
+    for item_index, item in enumerate(content):
         if item["type"] == "text":
             st.markdown(item["text"])
         elif item["type"] == "suggestions":
@@ -120,22 +246,58 @@ def display_content(
         elif item["type"] == "sql":
             with st.expander("SQL Query", expanded=False):
                 st.code(item["statement"], language="sql")
+                if item.get("query_id"):
+                    st.caption(f"Query ID: {item['query_id']}")
             with st.expander("Results", expanded=True):
-                with st.spinner("Running SQL..."):
-                    df = pd.read_sql(item["statement"], st.session_state.CONN)
-                    if len(df.index) > 1:
-                        data_tab, line_tab, bar_tab = st.tabs(
-                            ["Data", "Line Chart", "Bar Chart"]
-                        )
-                        data_tab.dataframe(df)
-                        if len(df.columns) > 1:
-                            df = df.set_index(df.columns[0])
-                        with line_tab:
-                            st.line_chart(df)
-                        with bar_tab:
-                            st.bar_chart(df)
-                    else:
-                        st.dataframe(df)
+                if "query_id" not in item:
+                    item["query_id"] = submit_sql(item["statement"])
+                if "status" not in item and is_sql_running(item["query_id"]):
+                    # Each running statement polls on its own, so statements finish concurrently
+                    st.fragment(display_sql_results, run_every=SQL_POLL_SECONDS)(
+                        item, f"{message_index}_{item_index}", polling=True
+                    )
+                else:
+                    display_sql_results(item, f"{message_index}_{item_index}")
+
+
+def display_sql_results(item: Dict[str, str], key: str, polling: bool = False) -> None:
+    """Displays the results of an asynchronous SQL item, or its progress while it runs."""
+    query_id = item["query_id"]
+    if "status" not in item:
+        if is_sql_running(query_id):
+            st.info("Running SQL...")
+            if st.button("Cancel", key=f"cancel_{key}"):
+                cancel_sql(query_id)
+                st.rerun()
+            return
+        # The terminal state is kept on the item, later reruns render it without asking Snowflake again
+        failed = st.session_state.CONN.is_an_error(st.session_state.CONN.get_query_status(query_id))
+        item["status"] = "failed" if failed else "done"
+        st.session_state.running_queries.discard(query_id)
+        if polling:
+            # Finished, rerun the page once so the results render without polling
+            st.rerun()
+    if item["status"] == "failed":
+        st.warning("The query was cancelled or failed.")
+        if st.button("Run again", key=f"rerun_{key}"):
+            item["query_id"] = submit_sql(item["statement"])
+            item.pop("status")
+            st.rerun()
+        return
+    df = fetch_sql_results(query_id)
+    if len(df.index) > 1:
+        data_tab, line_tab, bar_tab = st.tabs(
+            ["Data", "Line Chart", "Bar Chart"]
+        )
+        data_tab.dataframe(df)
+        if len(df.columns) > 1:
+            df = df.set_index(df.columns[0])
+        with line_tab:
+            st.line_chart(df)
+        with bar_tab:
+            st.bar_chart(df)
+    else:
+        st.dataframe(df)
 
 
 def display_table_info_sidebar():
@@ -245,8 +407,12 @@ def display_sample_queries_sidebar():
 st.title("Cortex Analyst")
 
 
+warm_up = start_warm_up()
+
 # Setup sidebars
 with st.sidebar:
+    if not warm_up.ready():
+        st.caption("⏳ Warming up, the first answer may take a little longer.")
     display_table_info_sidebar()
 
 # Main content and right sidebar using columns
@@ -258,6 +424,7 @@ with col1:
         st.session_state.messages = []
         st.session_state.suggestions = []
         st.session_state.active_suggestion = None
+        st.session_state.running_queries = set()
 
     # Chat messages container with fixed height
     chat_container = st.container(height=600)
@@ -2,22 +2,22 @@ import streamlit as st # Import python packages
 from snowflake.snowpark import Session
 from snowflake.ml.utils import connection_params
 from snowflake.connector import connect
-from snowflake.core import Root
-import requests
-from snowflake.cortex import Complete
-from snowflake.core import Root
-from components.dropdown import get_product_list
+from components.dropdown import get_dropdown_data, get_product_list
+from components import prefetch
+from components.pipeline import Pipeline, STAGE_DEADLINES, TURN_BUDGET, connection_parameters as get_connection_parameters, new_request, product_filter, pool_key
+from components.answer_client import AnswerServiceClient
+from components.admission import AdmissionRejected, admission
+from components.warmup import WarmUp, keep_warm_sql
+from components.deadlines import TurnBudget
+from components.conversation_store import SnowflakeConversationStore, SQLiteConversationStore
 import pandas as pd
-import json
 from PIL import Image
 import io
 import base64
 from openai import OpenAI
 import logging
 import time
-from datetime import datetime
-from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.backends import default_backend
+import uuid
 from pathlib import Path
 pd.set_option("max_colwidth",None)
 logging.basicConfig(filename='app.log', level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -34,24 +34,8 @@ db_env = st.secrets["environment"]
 ingest_db = f"{db_env}_SRC_INGEST"
 app_db = f"{db_env}_DP_APP"
 
-p_key_str = st.secrets["private_key_file"]
-p_key_bytes = p_key_str.encode('utf-8')
-p_key = serialization.load_pem_private_key(
-            p_key_bytes,
-            password=None, 
-            backend=default_backend()
-        )
-
 # Create Snowflake session
-connection_parameters = {
-   "account": st.secrets["account"],
-   "user": st.secrets["user"],
-   "password": st.secrets["password"],
-   "database": st.secrets["database"], 
-   "warehouse": st.secrets["warehouse"],
-   "schema": st.secrets["schema"],
-   "private_key": p_key          
-}
+connection_parameters = get_connection_parameters(st.secrets)
 
 @st.cache_resource
 def get_snowflake_session():
@@ -64,34 +48,77 @@ def get_snowflake_session():
 
 # Get the session only once and reuse it
 session = get_snowflake_session()
-root = Root(session)
 
+@st.cache_resource
+def get_pipeline():
+    return Pipeline(session, st.secrets)
+
+# Retrieval and answering live in components/pipeline.py so batch jobs and answer_service.py run them without Streamlit.
+# With answer_service_url set the app is a thin client and answer capacity scales separately from UI sessions.
+if st.secrets.get("answer_service_url"):
+    answer_client = AnswerServiceClient(st.secrets["answer_service_url"], st.secrets.get("answer_service_token"))
+    pipeline = None
+else:
+    answer_client = None
+    pipeline = get_pipeline()
 
+@st.cache_resource
+def start_warm_up():
+    # Once per process on the first run, so reference data and the warehouse are warm in the background
+    settings = st.secrets.get("warm_up", {})
+    tasks = [("dropdown_cache", lambda: get_dropdown_data(session, app_db))]
+    if pipeline is not None:
+        return WarmUp(pipeline.warm_up_tasks() + tasks, pipeline.keep_warm, settings).start()
+    query = settings.get("keep_warm_query", keep_warm_sql(f"{app_db}.APP_ASSETS.DROPDOWN_DATA"))
+    return WarmUp(tasks, lambda: session.sql(query).collect(), settings).start()
 
-### Default Values
-NUM_CHUNKS = 10 
-slide_window = 7 
+warm_up = start_warm_up()
 
-# service parameters
-CORTEX_SEARCH_DATABASE = st.secrets["database"]
-CORTEX_SEARCH_SCHEMA = st.secrets["schema"]
-CORTEX_SEARCH_SERVICE = f"CC_SEARCH_SERVICE_CS_{connection_parameters['database']}"
-######
-######
 
-# columns to query in the service
-COLUMNS = [
-    "chunk",
-    "relative_path",
-    "PRODUCTNAME",
-    "COMPANYNAME",
-    "CATEGORY_EPA_TYPE",
-    "SIGNAL_WORD"
-]
 
-                      
+### Default Values
+MAX_PREFETCH_PRODUCTS = 3 # only narrow product filters are worth warming
+RENDERED_WINDOW = 10 # most recent messages rendered as chat bubbles, older ones as one memoized block
+MEMORY_WINDOW = 30 # messages kept in session memory, the rest stay in the conversation store
+HISTORY_PAGE_SIZE = 20 # older messages paged in per click
+BUSY_MESSAGE = "Kronia is answering a lot of questions right now, please try again in a moment."
+DEGRADED_LABELS = {
+    "weather": "weather forecast",
+    "rewrite": "chat history in the search",
+    "context": "full label context",
+}
+slide_window = 7 
 
-svc = root.databases[CORTEX_SEARCH_DATABASE].schemas[CORTEX_SEARCH_SCHEMA].cortex_search_services[CORTEX_SEARCH_SERVICE]
+def start_prefetch():
+    # Warm the first turn while the user is still choosing filters and typing
+    filter_obj = product_filter(st.session_state.product_list)
+    latitude = st.session_state.get('user_latitude')
+    longitude = st.session_state.get('user_longitude')
+    signature = (pool_key(filter_obj), str(latitude), str(longitude), st.session_state.get('image_analysis'))
+    if st.session_state.get('prefetch_signature') == signature:
+        return
+    st.session_state.prefetch_signature = signature
+
+    if answer_client is not None:
+        # The service warms its own caches
+        product_list = st.session_state.product_list
+        if filter_obj is None or len(product_list) > MAX_PREFETCH_PRODUCTS:
+            product_list = "ALL"
+        prefetch.submit("service", answer_client.prefetch, product_list, latitude, longitude)
+        return
+
+    if filter_obj is not None and len(st.session_state.product_list) <= MAX_PREFETCH_PRODUCTS \
+            and prefetch.retrieval_cache.get(pool_key(filter_obj)) is None:
+        prefetch.submit("product pool", pipeline.prefetch_product_pool, filter_obj)
+    if latitude is not None and longitude is not None:
+        prefetch.submit("forecast", pipeline.fetch_forecast, latitude, longitude)
+
+@st.cache_resource
+def get_conversation_store():
+    # "snowflake" keeps conversations in APP_ASSETS, "sqlite" is a local stand-in
+    if st.secrets.get("conversation_store", "snowflake") == "sqlite":
+        return SQLiteConversationStore(st.secrets.get("conversation_db", "conversations.sqlite"))
+    return SnowflakeConversationStore(session, app_db)
 
 def load_help_content():
     help_file_path = Path(__file__).parent / 'components' / 'help_content.md'
@@ -103,11 +130,14 @@ def help_dialog():
     st.write(load_help_content())
 
 def show_help():
+    if not warm_up.ready():
+        st.sidebar.caption("⏳ Kronia is warming up, the first answer may take a little longer.")
     st.sidebar.title("Get Help")
     if st.sidebar.button("ℹ️ Read me"):
         help_dialog()
 
 
+@st.cache_data(ttl=3600, show_spinner=False)
 def search_locations(search_term = ''):
     if not search_term:
         # If no search term, return limited initial results
@@ -125,15 +155,15 @@ def search_locations(search_term = ''):
         LIMIT 200
         """
     
-    try:
-        result = session.sql(load_sql).to_pandas()
-        location_list = list(set(result['LOCATION'].to_list()))
-        return location_list, result  # Add empty option at start
-    except Exception as e:
-        st.error(f"Error fetching locations: {str(e)}")
-        return [""]
+    # Errors propagate so a failed lookup is not cached, the caller reports it
+    result = session.sql(load_sql).to_pandas()
+    location_list = list(set(result['LOCATION'].to_list()))
+    return location_list, result
    
 ### Functions
+# Sidebar sections are fragments, so their widgets rerun only their own section and not the chat.
+# They hand state to the chat through st.session_state, which the chat reads on its next full rerun.
+@st.fragment
 def show_settings():
     # Initialize session states
     if 'show_settings' not in st.session_state:
@@ -162,8 +192,8 @@ def show_settings():
         st.session_state.show_settings = not st.session_state.show_settings
 
     # Create settings button in the sidebar
-    st.sidebar.title("Personalization")
-    st.sidebar.button("⚙️ Settings", on_click=toggle_settings)
+    st.title("Personalization")
+    st.button("⚙️ Settings", on_click=toggle_settings)
 
     # Auto-hide logic
     if st.session_state.save_time:
@@ -173,10 +203,14 @@ def show_settings():
 
     # Show settings when enabled
     if st.session_state.show_settings:
-        with st.sidebar.expander("To get Weather-Based Pesticide Application Insights", expanded=True):
+        with st.expander("To get Weather-Based Pesticide Application Insights", expanded=True):
             # Location input
             query = st.text_input("Type location to filter dropdown", value=st.session_state.user_location)
-            locations, location_df = search_locations(query)
+            try:
+                locations, location_df = search_locations(query)
+            except Exception as e:
+                st.error(f"Error fetching locations: {str(e)}")
+                locations, location_df = [], pd.DataFrame(columns=['LOCATION', 'LATITUDE', 'LONGITUDE'])
             new_location = st.selectbox(
                 "Choose your Location",
                 options = locations,
@@ -186,7 +220,7 @@ def show_settings():
             )
             
             # Save button
-            if st.button("Save Settings"):
+            if st.button("Save Settings", disabled=location_df.empty):
                 latitude = location_df[location_df['LOCATION'] == new_location]['LATITUDE'].values[0]
                 longitude = location_df[location_df['LOCATION'] == new_location]['LONGITUDE'].values[0]
                 st.session_state.user_location = new_location
@@ -209,6 +243,7 @@ def show_settings():
                     """
                     session.sql(upsert_sql).collect()
                     st.success("Settings saved!") 
+                    start_prefetch()
                 except Exception as e:
                     st.error(f"Error saving settings: {e}")    
 
@@ -216,7 +251,7 @@ def image_workflow():
     if st.session_state.uploaded_file is not None and st.session_state.image_analysis is None:
         # Display the uploaded image
         image = Image.open(st.session_state.uploaded_file)
-        st.sidebar.image(image, caption="Uploaded Image", use_container_width =True)
+        st.image(image, caption="Uploaded Image", use_container_width =True)
         with st.spinner("Analyzing image..."):
             # Get image bytes
             img_bytes = st.session_state.uploaded_file.getvalue()
@@ -234,9 +269,13 @@ def image_workflow():
 @st.dialog("To Start Over", width="large")
 def show_reset():
     st.write("Click on the **three dots** in the top-right corner of the page and select **Rerun** from the dropdown menu.")
+    if st.button("Start a new conversation"):
+        start_conversation(str(uuid.uuid4()), [])
+        st.rerun()
 
+@st.fragment
 def config_options():
-    st.sidebar.title("Looking for Something Specific?")
+    st.title("Looking for Something Specific?")
     filtered_product_db = get_product_list(session, app_db)
 
     if isinstance(filtered_product_db, str) and filtered_product_db == "ALL":
@@ -247,12 +286,17 @@ def config_options():
         st.session_state.product_list = filtered_product_db['PRODUCTNAME'].unique().tolist()
         st.session_state.pest = filtered_product_db['PEST'].unique().tolist()
         st.session_state.site = filtered_product_db['SITE'].unique().tolist()
-            
-    uploaded_file = st.sidebar.file_uploader("Or upload an image with crop pest damage...", type=["jpg", "jpeg", "png"], key="uploaded_file")
+    start_prefetch()
+
+@st.fragment
+def image_upload():
+    uploaded_file = st.file_uploader("Or upload an image with crop pest damage...", type=["jpg", "jpeg", "png"], key="uploaded_file")
     image_workflow()
+    if 'product_list' in st.session_state:
+        start_prefetch()
     #st.sidebar.expander("Session State").write(st.session_state)
     #st.sidebar.button("Start Over", on_click=init_messages, key="start_over")
-    if st.sidebar.button("Want to Reset Chat?"):
+    if st.button("Want to Reset Chat?"):
         show_reset()
 
 
@@ -263,29 +307,6 @@ def config_options():
 #         st.session_state.messages = []
 
 
-def get_similar_chunks_search_service(query):
-
-    #response = svc.search(query, COLUMNS, limit=NUM_CHUNKS)
-
-    if st.session_state.product_list == "ALL":
-        response = svc.search(query, COLUMNS, limit=NUM_CHUNKS)
-    else: 
-        eq_conditions = [
-            {"@eq": {"PRODUCTNAME": product}}
-            for product in st.session_state.product_list
-        ]
-        if len(eq_conditions) == 1:
-            filter_obj = {"@eq": {"PRODUCTNAME": st.session_state.product_list[0]}}
-        else:
-            filter_obj = {"@or": eq_conditions}
-            #print(eq_conditions)
-        #filter_obj = {"@contains": {"PRODUCTNAME": st.session_state.product_list }}
-        response = svc.search(query, COLUMNS, filter=filter_obj, limit=NUM_CHUNKS)
-
-    #st.sidebar.json(response.json())
-    
-    return response.json()  
-
 def get_chat_history():
 #Get the history from the st.session_stage.messages according to the slide window parameter
     
@@ -293,142 +314,11 @@ def get_chat_history():
     
     start_index = max(0, len(st.session_state.messages) - slide_window)
     for i in range (start_index , len(st.session_state.messages) -1):
-         chat_history.append(st.session_state.messages[i])
+         message = st.session_state.messages[i]
+         chat_history.append({"role": message["role"], "content": message["content"]}) #Only the text goes into prompts
 
     return chat_history
 
-def summarize_question_with_history(chat_history, question):
-# To get the right context, use the LLM to first summarize the previous conversation
-# This will be used to get embeddings and find similar chunks in the docs for context
-
-    base_prompt = f"""
-    Based on the chat history below and the question, generate a query that extends the question
-    with the chat history provided. The query should be in natural language.
-    Answer with only the query. Do not add any explanation.
-
-    <chat_history>
-    {chat_history}
-    </chat_history>
-
-    <question>
-    {question}
-    </question>
-    """
-
-    if st.session_state.product_list == "ALL":      
-        prompt = base_prompt
-    else:
-        extra_details = f"""
-            <pest_in_scope>
-            {st.session_state.pest}
-            </pest_in_scope>
-
-            <site_in_scope>
-            {st.session_state.site}
-            </site_in_scope>
-            """
-
-        prompt = f"{base_prompt}{extra_details}"
-    
-    if st.session_state.image_analysis is not None:
-        prompt = f"{prompt} <image_analysis> {st.session_state.image_analysis} </image_analysis>"
-    
-    summary = Complete(st.session_state.model_name, prompt)   
-
-    #st.sidebar.text("Summary to be used to find similar chunks in the docs:")
-    #st.sidebar.caption(summary)
-
-    summary = summary.replace("'", "")
-
-    return summary
-
-def create_prompt (myquestion):
-    image_analysis = st.session_state.image_analysis
-    weather_forecast = st.session_state.weather_forecast
-    if image_analysis is not None:
-        question_with_image = f"{myquestion} <image_analysis>{image_analysis}</image_analysis>"
-    else:
-        question_with_image = myquestion
-    chat_history = get_chat_history()
-    if chat_history != []: #There is chat_history, so not first question
-        question_summary = summarize_question_with_history(chat_history, question_with_image)
-        prompt_context =  get_similar_chunks_search_service(question_summary)
-    else:
-        prompt_context = get_similar_chunks_search_service(question_with_image) #First question when using history
-  
-    base_answer_prompt = f"""
-           You are an agronomist who can advise on pesticides. 
-           
-           When the question is general about a product, you advice on topics such as pesticide's labeling and usage. You can speak about the active ingredient, 
-           dosage, relevant crop/plant, PPE needed, Environment hazards, mode of action, target pest. 
-            
-           You can utilize the information contained from the CONTEXT provided
-           between <context> and </context> tags.
-           
-           You can utilize the information contained from the IMAGE ANALYSIS provided
-           between <image_analysis> and </image_analysis> tags.
-
-            You can utilize the weather information contained for location ({st.session_state.user_location}) within
-           between <weather_forecast> and </weather_forecast> tags if needed. The weather information is in imperial units.
-
-           You offer a chat experience considering the information included in the CHAT HISTORY
-           provided between <chat_history> and </chat_history> tags..
-           When answering the question contained between <question> and </question> tags
-           be a bit detailed and please DO NOT HALLUCINATE. 
-           If you don´t have the information, say you do not have enough information to answer.
-           
-           Do not mention the CONTEXT used in your answer.
-           Do not mention the CHAT HISTORY used in your answer.
-           Do not repeat the CHAT HISTORY again in your answer.
-           Only answer the question if you can extract it from the CONTEXT provided.
-           
-           <chat_history>
-           {chat_history}
-           </chat_history>
-           <context>          
-           {prompt_context}
-           </context>
-           <image_analysis>
-           {image_analysis}
-           </image_analysis>
-           <weather_forecast>
-           {weather_forecast}
-           </weather_forecast>
-           <question>  
-           {myquestion}
-           </question>
-           """
-    answer = "Answer:"
-    if st.session_state.product_list == "ALL":
-        prompt = f"{base_answer_prompt} {answer}"
-    else:
-        extra_details = f"""
-            <pest_in_scope>
-            {st.session_state.pest}
-            </pest_in_scope>
-
-            <site_in_scope>
-            {st.session_state.site}
-            </site_in_scope>
-            """
-
-        prompt = f"{extra_details}{base_answer_prompt} {answer}"
-    
-    json_data = json.loads(prompt_context)
-
-    relative_paths = set(item['relative_path'] for item in json_data['results'])
-
-    return prompt, relative_paths
-
-
-def answer_question(myquestion):
-
-    prompt, relative_paths =create_prompt (myquestion)
-
-    response = Complete(st.session_state.model_name, prompt)   
-
-    return response, relative_paths
-
 def get_openai_client():
     api_key = st.secrets["OPENAI_API_KEY"]  # Store your API key in Streamlit secrets
     return OpenAI(api_key=api_key)
@@ -468,111 +358,6 @@ def analyze_image(image_bytes, prompt):
     except Exception as e:
         return f"Error analyzing image: {str(e)}"
 
-def get_weather_forecast(include_categories):
-    open_weather_api_key = st.secrets["open_weather_api_key"]
-
-    all_categories = ['current', 'minutely', 'hourly', 'daily', 'alerts']
-    default_exclusion = ['minutely', 'alerts']
-    include_categories = [option.strip() for option in include_categories.split(',')]
-    exclusions = [item for item in all_categories if item not in include_categories]
-    exclude_param = f"{','.join(exclusions)}"
-
-    ow_url = f"http://api.openweathermap.org/data/3.0/onecall?lat={st.session_state.user_latitude}&lon={st.session_state.user_longitude}&appid={open_weather_api_key}&exclude={exclude_param}&units=imperial"
-    response = requests.request("GET", ow_url)
-    
-    data = response.json()
-    required_metrics = ['temp', 'wind_speed', 'dew_point', 'humidity', 'uvi']
-    filtered_data = {}
-
-        # Process current data if exists
-    if 'current' in data:
-        filtered_data['current'] = {
-            metric: data['current'][metric] 
-            for metric in required_metrics 
-            if metric in data['current']
-        }
-    
-    # Process hourly data if exists
-    if 'hourly' in data:
-        filtered_data['hourly'] = [
-            {metric: hour[metric] 
-             for metric in required_metrics 
-             if metric in hour}
-            for hour in data['hourly']
-        ]
-    
-    # Process daily data if exists
-    if 'daily' in data:
-        filtered_data['daily'] = []
-        for day in data['daily']:
-            metrics = {}
-            # Add date from Unix timestamp
-            if 'dt' in day:
-                metrics['date'] = datetime.fromtimestamp(day['dt']).strftime('%Y-%m-%d')
-            
-            for metric in required_metrics:
-                if metric == 'temp' and 'temp' in day:
-                    # Handle nested temperature data in daily
-                    metrics['temp'] = day['temp']
-                elif metric in day:
-                    metrics[metric] = day[metric]
-            filtered_data['daily'].append(metrics)
-    
-    return(filtered_data)
-
-
-def need_weather(myquestion):
-    st.session_state.weather_forecast = None
-
-    need_weather_system_prompt = f"""
-    Analyze the text/question within the tag <question> and </question>. Does this question expects a current or future time/day/weather related context?
-    If the question has or expects time/days related context, reply with "Yes" otherwise reply with "No".
-    
-    <question>
-    {myquestion}
-    </question>
-    """
-    with st.spinner('Checking if need weather...'):
-        need_weather = Complete(st.session_state.model_name, need_weather_system_prompt)
-
-
-    if need_weather.strip() == "Yes":
-        labels = """
-              [{
-                'label': 'current',
-                'description': 'weather related to current/present time',
-                'examples': ['is today a good day?', 'can I do it now?', 'is the current weather okay?']
-            },{
-                'label': 'hourly',
-                'description': 'Weather focus in next few hours',
-                'examples': ['when should I start today?', 'Can I do in next n hours?']
-                },{
-                'label': 'daily',
-                'description': 'Weather focussed only on current day or future?',
-                'examples': ['is today a good day?', 'Can I do tomorrow?' , 'Would this week be better?']
-                }]
-        """
-
-        weather_category_system_prompt = f"""
-        Based on the question or the text within the tag <weather_forecast> and </weather_forecast>,
-        answer which among the following labels between the tag <labels> and </labels> would be suitable to look in weather forecast options?
-
-
-        <weather_forecast>
-        {myquestion}
-        </weather_forecast>
-        
-        <labels>
-        {labels}
-        </labels>
-
-        Reply with ONLY the labels and nothing else.
-        """
-
-        with st.spinner('Getting weather categories...'):
-            include_categories = Complete(st.session_state.model_name, weather_category_system_prompt)
-        st.session_state.weather_forecast = get_weather_forecast(include_categories)
-
 def create_structure():
     st.markdown(
         """
@@ -666,26 +451,142 @@ def close_snowflake_session():
     except Exception as e:
         st.error(f"Error closing Snowflake session: {str(e)}")
 
+def show_degraded(degraded):
+    if degraded:
+        skipped = ", ".join(f"{DEGRADED_LABELS.get(stage, stage)} ({reason})" for stage, reason in degraded.items())
+        st.caption(f"⏱️ Answered faster without: {skipped}")
+
+def answer_from_service(request, message_placeholder):
+    # Render answer text as it streams in, the other events fill in the result
+    result = {"answer": "", "relative_paths": [], "timings": {}, "degraded": {}, "urls": {}}
+    def deltas():
+        for event in answer_client.stream_answer(request):
+            if event["event"] == "delta":
+                yield event["text"]
+            elif event["event"] == "sources":
+                result["relative_paths"] = event["relative_paths"]
+            elif event["event"] == "done":
+                result.update(timings=event["timings"], degraded=event["degraded"], urls=event["urls"])
+    try:
+        result["answer"] = message_placeholder.write_stream(deltas())
+    except AdmissionRejected as e:
+        logging.warning(f"Answer service busy: {str(e)}")
+        result["answer"] = BUSY_MESSAGE
+        message_placeholder.markdown(result["answer"])
+    except Exception as e:
+        logging.error(f"Answer service failed: {str(e)}")
+        result["answer"] = "Kronia could not reach the answer service, please try again."
+        message_placeholder.markdown(result["answer"])
+    return result
+
+def rate_limit_id():
+    # Visitors who are not signed in all share default_user, rate limit them per browser session instead
+    user_id = st.session_state.get('user_id', 'default_user')
+    if user_id == 'default_user':
+        if 'rate_limit_id' not in st.session_state:
+            st.session_state.rate_limit_id = str(uuid.uuid4())
+        return st.session_state.rate_limit_id
+    return user_id
+
+def start_conversation(conversation_id, messages):
+    st.session_state.conversation_id = conversation_id
+    st.session_state.messages = messages
+    st.session_state.next_index = messages[-1]["index"] + 1 if messages else 0
+    st.session_state.earlier_messages = []
+    st.session_state.pop('transcript_cache', None)
+
+def restores_conversations():
+    # Signed-out visitors all share default_user, restoring their latest conversation would show one visitor's chat to another
+    return st.session_state.get('user_id', 'default_user') != 'default_user'
+
+def init_conversation():
+    # Restore the user's latest conversation after a refresh, keeping only a recent window in memory
+    user_id = st.session_state.get('user_id', 'default_user')
+    if not restores_conversations():
+        start_conversation(str(uuid.uuid4()), [])
+        return
+    try:
+        store = get_conversation_store()
+        conversation_id = store.latest_conversation(user_id)
+        messages = store.load_page(user_id, conversation_id, limit=MEMORY_WINDOW) if conversation_id else []
+    except Exception as e:
+        logging.error(f"Could not restore conversation: {str(e)}")
+        conversation_id, messages = None, []
+    start_conversation(conversation_id or str(uuid.uuid4()), messages)
+
+def add_message(message):
+    message["index"] = st.session_state.next_index
+    st.session_state.next_index += 1
+    st.session_state.messages.append(message)
+    try:
+        get_conversation_store().append(st.session_state.get('user_id', 'default_user'), st.session_state.conversation_id, message)
+    except Exception as e:
+        logging.error(f"Could not store message: {str(e)}")
+    if len(st.session_state.messages) > MEMORY_WINDOW:
+        st.session_state.messages = st.session_state.messages[-MEMORY_WINDOW:]
+        st.session_state.pop('transcript_cache', None)
+
+def load_earlier_messages():
+    loaded = st.session_state.earlier_messages + st.session_state.messages
+    page = get_conversation_store().load_page(
+        st.session_state.get('user_id', 'default_user'),
+        st.session_state.conversation_id,
+        before_index=loaded[0]["index"],
+        limit=HISTORY_PAGE_SIZE,
+    )
+    st.session_state.earlier_messages = page + st.session_state.earlier_messages
+
+def message_markdown(messages):
+    return "\n\n---\n\n".join(f"**{message['role'].title()}:** {message['content']}" for message in messages)
+
+def render_transcript():
+    # Rerun cost stays flat as the chat grows, older turns are one markdown block extended incrementally
+    messages = st.session_state.messages
+    loaded = st.session_state.earlier_messages + messages
+    if loaded and loaded[0]["index"] > 0:
+        st.button("Load earlier messages", on_click=load_earlier_messages)
+    if st.session_state.earlier_messages:
+        with st.expander(f"From history ({len(st.session_state.earlier_messages)} messages)"):
+            st.markdown(message_markdown(st.session_state.earlier_messages))
+
+    older = len(messages) - RENDERED_WINDOW
+    if older > 0:
+        count, text = st.session_state.get('transcript_cache', (0, ""))
+        if count != older:
+            if 0 < count < older:
+                text = f"{text}\n\n---\n\n{message_markdown(messages[count:older])}"
+            else:
+                text = message_markdown(messages[:older])
+            st.session_state.transcript_cache = (older, text)
+        with st.expander(f"Earlier conversation ({older} messages)"):
+            st.markdown(text)
+
+    for message in messages[max(older, 0):]:
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
+            if message.get("relative_paths"):
+                st.caption(f"Related Documents: {', '.join(message['relative_paths'])}")
+            show_degraded(message.get("degraded"))
+
 def main():
 
     create_structure()
-    st.session_state.model_name = 'mistral-large2'
     show_help()
-    show_settings()
-    config_options()
+    with st.sidebar:
+        show_settings()
+        config_options()
+        image_upload()
     if st.session_state.get("messages") is None:
-        st.session_state.messages = []
+        init_conversation()
     #init_messages()
 
     # Display chat messages from history on app rerun
-    for message in st.session_state.messages:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
+    render_transcript()
     
     # Accept user input
     if question := st.chat_input("What do you want to know about your products?"):
         # Add user message to chat history
-        st.session_state.messages.append({"role": "user", "content": question})
+        add_message({"role": "user", "content": question})
         # Display user message in chat message container
         with st.chat_message("user"):
             st.markdown(question)
@@ -696,23 +597,53 @@ def main():
             question = question.replace("'","")
     
             with st.spinner(f"Kronia thinking..."):
-                need_weather(question)
-                response, relative_paths = answer_question(question)            
-                response = response.replace("'", "")
-                message_placeholder.markdown(response)
+                request = new_request(
+                    question,
+                    product_list=st.session_state.product_list,
+                    pest=st.session_state.pest,
+                    site=st.session_state.site,
+                    location=st.session_state.get('user_location', ''),
+                    latitude=st.session_state.get('user_latitude'),
+                    longitude=st.session_state.get('user_longitude'),
+                    image_analysis=st.session_state.image_analysis,
+                    chat_history=get_chat_history(),
+                    user_id=rate_limit_id(),
+                )
+                if answer_client is not None:
+                    result = answer_from_service(request, message_placeholder)
+                else:
+                    budget = TurnBudget(TURN_BUDGET, STAGE_DEADLINES)
+                    try:
+                        result = pipeline.answer(request, budget)
+                    except AdmissionRejected as e:
+                        logging.warning(f"Turn not admitted: {str(e)}")
+                        result = {"answer": BUSY_MESSAGE, "relative_paths": [], "timings": budget.timings, "degraded": budget.degraded}
+                    result["timings"]["total"] = round(budget.elapsed(), 2)
+                    logging.info(f"Admission: {admission.get_stats()}")
+                    message_placeholder.markdown(result["answer"])
+                response, relative_paths = result["answer"], result["relative_paths"]
+                show_degraded(result["degraded"])
+                logging.info(f"Turn timings: {result['timings']}, degraded: {result['degraded']}")
 
                 if relative_paths != "None":
                     st.markdown("Related Documents")
                     for path in relative_paths:
-                        cmd2 = f"select GET_PRESIGNED_URL(@{ingest_db}.EPA_RAW.PDF_STORE, '{path}', 360) as URL_LINK from directory(@{ingest_db}.EPA_RAW.PDF_STORE)"
-                        df_url_link = session.sql(cmd2).to_pandas()
-                        url_link = df_url_link._get_value(0,'URL_LINK')
+                        if answer_client is not None:
+                            url_link = result["urls"].get(path, "")
+                        else:
+                            url_link = pipeline.get_presigned_url(path)
             
                         display_url = f"Doc: [{path}]({url_link})"
                         st.markdown(display_url)
                 
         
-        st.session_state.messages.append({"role": "assistant", "content": response})
+        add_message({
+            "role": "assistant",
+            "content": response,
+            "relative_paths": relative_paths,
+            "timings": result["timings"],
+            "degraded": result["degraded"],
+        })
 
 
 if __name__ == "__main__":
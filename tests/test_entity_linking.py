@@ -0,0 +1,57 @@
+from components.entity_linking import EntityLinker, is_distinctive
+from components.rerank import agrees, merge_results
+
+ENTITIES = [
+    ("PRODUCTNAME", "OUT"),
+    ("PRODUCTNAME", "Max"),
+    ("PRODUCTNAME", "Apple Guard"),
+    ("PRODUCTNAME", "Sevin Insect Killer"),
+    ("PRODUCTNAME", "Roundup"),
+    ("PRODUCTNAME", "Roundup PowerMAX"),
+    ("PEST", "Rats"),
+    ("PEST", "Ants"),
+    ("SITE", "Lawns"),
+]
+
+
+def linker():
+    return EntityLinker(ENTITIES)
+
+
+def test_single_ordinary_word_products_do_not_link():
+    assert linker().link("It is hot out today, can I spray?") == {}
+    assert linker().link("What is the max rate per acre?") == {}
+    assert not is_distinctive("OUT")
+    assert is_distinctive("Roundup")
+
+
+def test_common_words_are_not_corrected_into_names():
+    assert linker().link("When should I apply it?") == {}
+    assert linker().link("What rates are allowed?") == {}
+
+
+def test_pests_and_sites_match_exactly():
+    assert linker().link("How do I keep rats off lawns?") == {"PEST": ["Rats"], "SITE": ["Lawns"]}
+
+
+def test_misspelled_product_is_corrected():
+    assert linker().link("Is sevinn insect killer safe for ants?") == {
+        "PEST": ["Ants"],
+        "PRODUCTNAME": ["Sevin Insect Killer"],
+    }
+
+
+def test_longest_name_wins():
+    assert linker().link("roundup powermax on a driveway") == {"PRODUCTNAME": ["Roundup PowerMAX"]}
+
+
+def test_unfiltered_hits_merge_when_the_link_disagrees():
+    linked = [{"relative_path": "out.pdf", "chunk": "a", "PRODUCTNAME": "OUT"}]
+    unfiltered = [
+        {"relative_path": "sevin.pdf", "chunk": "b", "PRODUCTNAME": "Sevin Insect Killer"},
+        {"relative_path": "out.pdf", "chunk": "a", "PRODUCTNAME": "OUT"},
+    ]
+
+    assert not agrees(linked, unfiltered, top_k=1)
+    assert agrees(linked, unfiltered, top_k=2)
+    assert merge_results(linked, unfiltered) == linked + unfiltered[:1]
@@ -0,0 +1,35 @@
+from components.fact_sheets import lookup_facts
+
+FACT_SHEETS = {
+    "SEVIN INSECT KILLER": {
+        "PRODUCTNAME": "Sevin Insect Killer", "SIGNAL_WORD": "CAUTION", "ACTIVE_INGREDIENT": "Carbaryl 22.5%",
+        "PPE": "Long sleeves and gloves", "MODE_OF_ACTION": "IRAC 1A", "COMPANYNAME": "GardenTech",
+        "RELATIVE_PATH": "sevin.pdf",
+    },
+    "OUT": {
+        "PRODUCTNAME": "OUT", "SIGNAL_WORD": "WARNING", "ACTIVE_INGREDIENT": "Glyphosate 41%",
+        "PPE": "Goggles", "MODE_OF_ACTION": "HRAC 9", "COMPANYNAME": "Acme", "RELATIVE_PATH": "out.pdf",
+    },
+}
+
+
+def test_fact_question_is_served_from_the_table():
+    answer, paths = lookup_facts("What's the signal word for Sevin Insect Killer?", FACT_SHEETS)
+    assert "CAUTION" in answer
+    assert paths == {"sevin.pdf"}
+
+
+def test_sidebar_selection_bounds_the_product():
+    answer, _ = lookup_facts("What PPE is needed?", FACT_SHEETS, ["Sevin Insect Killer"])
+    assert "Long sleeves" in answer
+    assert lookup_facts("What is the PPE for Sevin Insect Killer?", FACT_SHEETS, ["OUT"]) is None
+
+
+def test_ordinary_word_names_are_not_mentions():
+    assert lookup_facts("What PPE is needed out in the field?", FACT_SHEETS, ["Sevin Insect Killer"]) is None
+    assert lookup_facts("What is the PPE out?", FACT_SHEETS) is None
+
+
+def test_partly_covered_questions_go_through_rag():
+    assert lookup_facts("What are the inert ingredients in Sevin Insect Killer?", FACT_SHEETS) is None
+    assert lookup_facts("What is the signal word for Sevin Insect Killer and what does it do?", FACT_SHEETS) is None
@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+from components.local_index import SYNC_BATCH_SIZE, LocalChunkIndex
+
+COLUMNS = ["chunk", "relative_path", "PRODUCTNAME"]
+DIM = 8
+
+
+class FakeResult:
+    def __init__(self, df):
+        self.df = df
+
+    def to_pandas(self):
+        return self.df
+
+
+class FakeSession:
+    """Answers the fingerprint query and the per-batch chunk queries LocalChunkIndex.sync issues."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def sql(self, query, params=None):
+        if "HASH_AGG" in query:
+            prints = self.chunks.groupby("relative_path")["chunk"].apply(lambda chunks: str(hash(tuple(chunks))))
+            return FakeResult(pd.DataFrame({"relative_path": prints.index, "fingerprint": prints.values}))
+        paths = params[1:]
+        batch = self.chunks[self.chunks["relative_path"].isin(paths)].copy()
+        batch["embedding"] = [embedding(chunk).tolist() for chunk in batch["chunk"]]
+        return FakeResult(batch)
+
+
+def embedding(chunk):
+    return np.random.default_rng(abs(hash(chunk)) % 2**32).random(DIM).astype(np.float32)
+
+
+def corpus(paths, chunks_per_path=2, version=0):
+    return pd.DataFrame([
+        {"chunk": f"{path} chunk {i} v{version}", "relative_path": path, "PRODUCTNAME": f"Product {path}"}
+        for path in paths
+        for i in range(chunks_per_path)
+    ])
+
+
+def test_sync_across_batches(tmp_path):
+    paths = [f"label_{i}.pdf" for i in range(SYNC_BATCH_SIZE * 2 + 20)]
+    index = LocalChunkIndex(str(tmp_path), COLUMNS, dim=DIM)
+
+    stats = index.sync(FakeSession(corpus(paths)), "CHUNKS")
+
+    assert stats == {"changed": len(paths), "removed": 0, "chunks": len(paths) * 2}
+    assert list(index.row_ids) == list(range(len(paths) * 2))
+    assert len(index.embeddings) == len(paths) * 2
+
+    # Every row's embedding is the one stored for its chunk
+    chunk = index.metadata.iloc[-1]["chunk"]
+    top = index.search(embedding(chunk), COLUMNS, limit=1)["results"][0]
+    assert top["chunk"] == chunk
+
+
+def test_incremental_sync_replaces_changed_paths(tmp_path):
+    paths = [f"label_{i}.pdf" for i in range(SYNC_BATCH_SIZE + 5)]
+    index = LocalChunkIndex(str(tmp_path), COLUMNS, dim=DIM)
+    index.sync(FakeSession(corpus(paths)), "CHUNKS")
+
+    changed = corpus(paths[:3], version=1)
+    kept = corpus(paths[3:-1])
+    stats = index.sync(FakeSession(pd.concat([changed, kept])), "CHUNKS")
+
+    assert stats["changed"] == 3
+    assert stats["removed"] == 1
+    assert len(index) == (len(paths) - 1) * 2
+    assert set(index.metadata["chunk"]) == set(changed["chunk"]) | set(kept["chunk"])
+
+    # A reopened index sees the same rows
+    reopened = LocalChunkIndex(str(tmp_path), COLUMNS, dim=DIM)
+    assert len(reopened) == len(index)
+
+
+def test_filtered_search(tmp_path):
+    index = LocalChunkIndex(str(tmp_path), COLUMNS, dim=DIM)
+    index.sync(FakeSession(corpus(["a.pdf", "b.pdf"])), "CHUNKS")
+
+    results = index.search(np.ones(DIM), COLUMNS, filter={"@eq": {"PRODUCTNAME": "Product b.pdf"}}, limit=10)["results"]
+
+    assert {result["relative_path"] for result in results} == {"b.pdf"}
@@ -0,0 +1,30 @@
+from components.query_rewrite import mentions_product, needs_history
+
+PRODUCTS = ["ACE", "OUT", "Max", "Sevin", "Sevin Insect Killer"]
+HISTORY = [
+    {"role": "user", "content": "What is the rate for Sevin Insect Killer on roses?"},
+    {"role": "assistant", "content": "Use 1 fl oz per gallon."},
+]
+
+
+def test_names_match_whole_words_only():
+    assert not mentions_product("Can I spray it on a hard surface?", PRODUCTS)
+    assert mentions_product("Is Sevin Insect Killer safe around bees?", PRODUCTS)
+
+
+def test_ordinary_word_names_are_not_mentions():
+    assert not mentions_product("Can I spray it when it is hot out?", PRODUCTS)
+    assert not mentions_product("What is the max rate per acre?", PRODUCTS)
+
+
+def test_reference_wins_over_a_named_product():
+    assert needs_history("Can I mix Sevin with it?", HISTORY, PRODUCTS)
+
+
+def test_non_anaphoric_words_do_not_force_a_rewrite():
+    assert not needs_history("Is there a fungicide labeled for black spot on apple trees?", HISTORY, PRODUCTS)
+    assert not needs_history("Which insecticide is one of the safest options near honey bee hives?", HISTORY, PRODUCTS)
+
+
+def test_standalone_question_naming_its_product_is_not_rewritten():
+    assert not needs_history("How long before harvest can I spray Sevin Insect Killer on tomatoes?", HISTORY, PRODUCTS)